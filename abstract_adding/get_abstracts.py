@@ -1,40 +1,359 @@
+"""
+Add abstracts to the labelled papers of the ICAPS 2024 dataset.
+
+    python get_abstracts.py
+        Fetch the abstract of every arXiv paper of papers_data.json and write updated_papers_data.json.
+    python get_abstracts.py --enrich [--input updated_papers_data.json] [--workers 4]
+        Only fetch the abstracts that are still missing. Results are appended to a JSON-lines checkpoint as they
+        arrive, so an interrupted run loses nothing, and the next run only retries the ids that failed.
+
+Both modes first look the ids up in the scraper's SQLite store (scraping/db/arxiv_papers.db, any version of a
+paper matches) and only request the rest from the API. Papers fetched from the API are written back into the store,
+so the next run finds them locally. Pass --no-local to go straight to the API, or --db to use another store.
+"""
+import argparse
 import json
-import requests
+import os
+import re
+import sqlite3
+import sys
 import xml.etree.ElementTree as ET
-import time
-
-
-def get_abstract(arxiv_id):
-    base_url = "http://export.arxiv.org/api/query?id_list="
-    url = base_url + arxiv_id
-    response = requests.get(url)
-
-    if response.status_code == 200:
-        root = ET.fromstring(response.content)
-        # The default namespace is defined in the 'feed' tag
-        namespace = {'atom': 'http://www.w3.org/2005/Atom'}
-        summary = root.find('.//atom:entry/atom:summary', namespace)
-        if summary is not None:
-            return summary.text.strip()
-    else:
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+# Share the scrapers' on-disk response cache and rate limiter, so re-runs don't repeat API calls
+SCRAPING_SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scraping', 'scripts')
+sys.path.append(SCRAPING_SCRIPTS_DIR)
+from bulk_ingest import configure_connection, upsert_rows  # noqa: E402
+from rate_limiter import TokenBucket  # noqa: E402
+from response_cache import CachedSession, ResponseCache  # noqa: E402
+from schema import init_schema, parse_entry_id  # noqa: E402
+
+CACHE_FILE = os.path.join(SCRAPING_SCRIPTS_DIR, '..', 'cache', 'arxiv_responses.db')
+
+# The scraper's paper store, looked up before the API
+DB_FILE = os.path.join(SCRAPING_SCRIPTS_DIR, '..', 'db', 'arxiv_papers.db')
+
+API_URL = "http://export.arxiv.org/api/query"
+
+# arXiv ids per id_list request. The API answers up to a few hundred ids per request without trouble.
+BATCH_SIZE = 100
+
+# Abstracts rarely change, so cached entries are kept for 30 days
+CACHE_TTL = 30 * 24 * 3600
+
+NAMESPACE = {'atom': 'http://www.w3.org/2005/Atom'}
+
+NOT_FOUND = "Abstract not found"
+
+
+def open_session(cache_file=CACHE_FILE):
+    """
+    Create the HTTP session for the API, backed by the scrapers' response cache (created if needed).
+    Set ARXIV_CACHE_MODE to cache-only, refresh or bypass to change how the cache is used.
+    The session keeps its connection to the API alive between requests, and network requests are spaced 3 seconds
+    apart as the arXiv API terms ask.
+    :return: CachedSession
+    """
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    return CachedSession(ResponseCache(cache_file, ttl=CACHE_TTL), os.environ.get('ARXIV_CACHE_MODE', 'default'),
+                         limiter=TokenBucket())
+
+
+def arxiv_id_from_link(link):
+    """Return the arXiv id (without version) of an arxiv.org link, or None for other links"""
+    if 'arxiv.org' not in link:
+        return None
+    try:
+        return parse_entry_id(link)[0]
+    except ValueError:
+        return None
+
+
+def open_store(path=DB_FILE):
+    """
+    Open the scraper's paper store, creating its normalised tables if needed.
+    :return: SQLite connection, or None if there is no store at `path`
+    """
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(path)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'papers'").fetchone() is None:
+        conn.close()
+        return None
+    configure_connection(conn)
+    init_schema(conn)
+    return conn
+
+
+def lookup_local(conn, arxiv_ids):
+    """
+    Look up the abstracts of many papers in the local store with one join, whatever version suffix the ids carry.
+    :return: Dictionary mapping each requested id found in the store to its abstract
+    """
+    requested = {}
+    for arxiv_id in arxiv_ids:
+        requested.setdefault(parse_entry_id(arxiv_id)[0], []).append(arxiv_id)
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup_ids (arxiv_id TEXT PRIMARY KEY)")
+    with conn:
+        conn.execute("DELETE FROM lookup_ids")
+        conn.executemany("INSERT INTO lookup_ids (arxiv_id) VALUES (?)", [(base_id,) for base_id in requested])
+        rows = conn.execute("""SELECT a.arxiv_id, a.abstract FROM lookup_ids l JOIN articles a USING (arxiv_id)
+                               WHERE a.abstract IS NOT NULL AND a.abstract != ''""").fetchall()
+    return {arxiv_id: abstract.strip() for base_id, abstract in rows for arxiv_id in requested[base_id]}
+
+
+def write_back(conn, rows):
+    """
+    Store papers fetched from the API in the local store. Papers already stored are left as they are.
+    :param rows: Dictionary returned by fetch_rows
+    :return: Number of papers added to the store
+    """
+    with conn:
+        inserted, _ = upsert_rows(conn, {row[0]: row for row in rows.values()}.values())
+    return len(inserted)
+
+
+def get_abstracts(arxiv_ids, batch_size=BATCH_SIZE, conn=None, session=None):
+    """
+    Fetch the abstracts of many papers with one id_list request per batch of ids.
+    :param arxiv_ids: arXiv ids, with or without version suffix
+    :param conn: Optional connection to the local store (see open_store). Ids found there are not requested,
+                 and papers fetched from the API are written back.
+    :param session: Session for the API requests (see open_session; a new one is opened if ids need fetching)
+    :return: Dictionary mapping each requested id to its abstract. Ids the API doesn't know are left out.
+    """
+    arxiv_ids = list(dict.fromkeys(arxiv_ids))
+    abstracts = lookup_local(conn, arxiv_ids) if conn is not None else {}
+    remaining = [arxiv_id for arxiv_id in arxiv_ids if arxiv_id not in abstracts]
+    if conn is not None:
+        print(f"Found {len(abstracts)} of {len(arxiv_ids)} abstracts in the local store, fetching {len(remaining)}")
+    if remaining and session is None:
+        session = open_session()
+    for start in range(0, len(remaining), batch_size):
+        batch = remaining[start:start + batch_size]
+        try:
+            rows = fetch_rows(batch, session)
+        except Exception as e:
+            print(f"Request for {len(batch)} ids failed: {str(e)}")
+            continue
+        abstracts.update((arxiv_id, row[4]) for arxiv_id, row in rows.items())
+        if conn is not None and rows:
+            write_back(conn, rows)
+    return abstracts
+
+
+def fetch_batch(batch, session):
+    """
+    Fetch the abstracts of one batch of ids with a single id_list request.
+    :return: Dictionary mapping each requested id to its abstract. Ids the API doesn't know are left out.
+    :raise requests.HTTPError: If the request fails
+    """
+    return {arxiv_id: row[4] for arxiv_id, row in fetch_rows(batch, session).items()}
+
+
+def _text(element, path):
+    """Whitespace-normalised text of a child element, or '' if it is missing"""
+    child = element.find(path, NAMESPACE)
+    return re.sub(r'\s+', ' ', child.text).strip() if child is not None and child.text else ''
+
+
+def fetch_rows(batch, session):
+    """
+    Fetch one batch of ids with a single id_list request.
+    :param session: Session for the request (see open_session)
+    :return: Dictionary mapping each requested id to a row of the scraper's papers table
+             (id, title, authors, published_date, abstract, url, categories). Ids the API doesn't know are left out.
+    :raise requests.HTTPError: If the request fails
+    """
+    # Entries come back with their latest (or requested) version, so match them on the id without version
+    requested = {}
+    for arxiv_id in batch:
+        requested.setdefault(parse_entry_id(arxiv_id)[0], []).append(arxiv_id)
+    # id_list returns at most max_results entries (10 by default), so ask for the whole batch
+    response = session.get(API_URL, params={'id_list': ','.join(batch), 'max_results': len(batch)})
+    response.raise_for_status()
+
+    rows = {}
+    root = ET.fromstring(response.content)
+    for entry in root.findall('atom:entry', NAMESPACE):
+        entry_id = _text(entry, 'atom:id')
+        summary = entry.find('atom:summary', NAMESPACE)
+        if not entry_id or summary is None or summary.text is None:
+            continue
+        try:
+            base_id = parse_entry_id(entry_id)[0]
+        except ValueError:
+            # Error entries (e.g. for malformed ids) carry an api/errors URL instead of an abs URL
+            continue
+        # Same fields as bulk_ingest.paper_to_row builds from an arxiv.Result
+        row = (entry_id, _text(entry, 'atom:title'),
+               ', '.join(_text(author, 'atom:name') for author in entry.findall('atom:author', NAMESPACE)),
+               _text(entry, 'atom:published')[:10], summary.text.strip(), entry_id,
+               ', '.join(category.get('term') for category in entry.findall('atom:category', NAMESPACE)))
+        for arxiv_id in requested.get(base_id, []):
+            rows[arxiv_id] = row
+    return rows
+
+
+def get_abstract(arxiv_id, session=None):
+    abstract = get_abstracts([arxiv_id], session=session).get(arxiv_id)
+    if abstract is None:
         print(f"Abstract not found for {arxiv_id}")
-        return "Abstract not found"
+        return NOT_FOUND
+    return abstract
+
+
+def has_abstract(paper):
+    return bool(paper.get('abstract')) and paper['abstract'] != NOT_FOUND
+
+
+def load_checkpoint(path):
+    """
+    Read a JSON-lines checkpoint. Later lines win, so a successful retry replaces an earlier failure.
+    :return: Dictionary mapping arXiv id to its last record ({'abstract': ...}, {'not_found': true} or {'error': ...})
+    """
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut off by an interrupted run
+                continue
+            records[record['arxiv_id']] = record
+    return records
+
+
+def enrich(papers_data, checkpoint_file, workers=4, batch_size=BATCH_SIZE, conn=None, session=None):
+    """
+    Add the missing abstracts of papers in place, fetching batches concurrently under the shared rate limit.
+    Papers that already have an abstract, and ids already resolved in the checkpoint or found in the local store
+    (if `conn` is given), are not requested again. Every finished batch is appended to the checkpoint immediately,
+    and written back to the local store.
+    :param session: Session shared by the workers (see open_session; a new one is opened if ids need fetching)
+    :return: Tuple of (number of abstracts added, list of papers still without abstract)
+    """
+    records = load_checkpoint(checkpoint_file)
+    missing = {}
+    for paper in papers_data:
+        arxiv_id = arxiv_id_from_link(paper['link'])
+        if not has_abstract(paper) and arxiv_id:
+            missing.setdefault(arxiv_id, []).append(paper)
+
+    # Only ids without a final answer (never fetched, or failed last time) go to the API
+    unresolved = [arxiv_id for arxiv_id in missing
+                  if 'abstract' not in records.get(arxiv_id, {}) and not records.get(arxiv_id, {}).get('not_found')]
+    local = lookup_local(conn, unresolved) if conn is not None else {}
+    to_fetch = [arxiv_id for arxiv_id in unresolved if arxiv_id not in local]
+    print(f"{len(missing)} arXiv ids without abstract, {len(missing) - len(unresolved)} resolved by the checkpoint, "
+          f"{len(local)} found in the local store, fetching {len(to_fetch)}")
+
+    if to_fetch and session is None:
+        session = open_session()
+    batches = [to_fetch[start:start + batch_size] for start in range(0, len(to_fetch), batch_size)]
+    with open(checkpoint_file, 'a') as checkpoint, ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch_rows, batch, session): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            now = datetime.now().isoformat()
+            rows = {}
+            try:
+                rows = future.result()
+                new_records = []
+                for arxiv_id in batch:
+                    if arxiv_id in rows:
+                        new_records.append({'arxiv_id': arxiv_id, 'abstract': rows[arxiv_id][4], 'fetched_at': now})
+                    else:
+                        new_records.append({'arxiv_id': arxiv_id, 'not_found': True, 'fetched_at': now})
+            except Exception as e:
+                print(f"Request for {len(batch)} ids failed, they will be retried on the next run: {str(e)}")
+                new_records = [{'arxiv_id': arxiv_id, 'error': str(e), 'fetched_at': now} for arxiv_id in batch]
+            for record in new_records:
+                checkpoint.write(json.dumps(record) + '\n')
+                records[record['arxiv_id']] = record
+            checkpoint.flush()
+            # Only this thread uses the connection; the workers just fetch
+            if conn is not None and rows:
+                write_back(conn, rows)
+
+    added = 0
+    for arxiv_id, papers in missing.items():
+        abstract = local.get(arxiv_id, records.get(arxiv_id, {}).get('abstract'))
+        if abstract is not None:
+            for paper in papers:
+                paper['abstract'] = abstract
+                added += 1
+    return added, [paper for paper in papers_data if not has_abstract(paper)]
+
+
+def refresh_all(conn=None, session=None):
+    # Load the existing data
+    with open('papers_data.json', 'r') as f:
+        papers_data = json.load(f)
+
+    # Fetch all abstracts in batches, then update each paper with its abstract
+    arxiv_ids = [arxiv_id_from_link(paper['link']) for paper in papers_data]
+    abstracts = get_abstracts([arxiv_id for arxiv_id in arxiv_ids if arxiv_id], conn=conn, session=session)
+    print(f"Got {len(abstracts)} abstracts for {len(papers_data)} papers")
+    for paper, arxiv_id in zip(papers_data, arxiv_ids):
+        if arxiv_id not in abstracts:
+            print(f"Abstract not found for {paper['title']} ({paper['link']})")
+        paper['abstract'] = abstracts.get(arxiv_id, NOT_FOUND)
+
+    # Save the updated data
+    with open('updated_papers_data.json', 'w') as f:
+        json.dump(papers_data, f, indent=4)
+
+    print("Papers data updated with abstracts.")
+
+
+def enrich_file(input_file, output_file, checkpoint_file, workers, conn=None, session=None):
+    """Enrich a papers JSON file and write it atomically, dropping the placeholder of papers still missing one"""
+    with open(input_file, 'r') as f:
+        papers_data = json.load(f)
+    added, still_missing = enrich(papers_data, checkpoint_file, workers=workers, conn=conn, session=session)
+
+    for paper in still_missing:
+        if paper.get('abstract') == NOT_FOUND:
+            del paper['abstract']
+    tmp_file = output_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(papers_data, f, indent=4)
+    os.replace(tmp_file, output_file)
 
+    print(f"Added {added} abstracts, {len(still_missing)} papers still without abstract")
+    for paper in still_missing:
+        print(f"  {paper['title']} ({paper['link']})")
 
-# Load the existing data
-with open('papers_data.json', 'r') as f:
-    papers_data = json.load(f)
 
-# Update each paper with its abstract
-for paper in papers_data:
-    arxiv_id = paper['link'].split('/')[-1]
-    print(f"Getting abstract for {paper['title']} with arXiv ID {arxiv_id}")
-    abstract = get_abstract(arxiv_id)
-    paper['abstract'] = abstract
+def main():
+    parser = argparse.ArgumentParser(description="Add abstracts from the arXiv API to the labelled papers")
+    parser.add_argument('--enrich', action='store_true', help="Only fetch missing abstracts, with a checkpoint")
+    parser.add_argument('--input', default='updated_papers_data.json', help="Papers to enrich (with --enrich)")
+    parser.add_argument('--output', help="Where to write the enriched papers (default: the input file)")
+    parser.add_argument('--checkpoint', default='abstracts_checkpoint.jsonl', help="JSON-lines checkpoint file")
+    parser.add_argument('--workers', type=int, default=4, help="Concurrent batch requests (default: 4)")
+    parser.add_argument('--db', default=DB_FILE, help="Scraper database to look abstracts up in first")
+    parser.add_argument('--no-local', action='store_true', help="Don't use the scraper database")
+    args = parser.parse_args()
 
+    conn = None if args.no_local else open_store(args.db)
+    if conn is None and not args.no_local:
+        print(f"No scraper database at {args.db}, fetching everything from the API")
+    session = open_session()
+    try:
+        if args.enrich:
+            enrich_file(args.input, args.output or args.input, args.checkpoint, args.workers, conn, session)
+        else:
+            refresh_all(conn, session)
+    finally:
+        session.close()
+        if conn is not None:
+            conn.close()
 
-# Save the updated data
-with open('updated_papers_data.json', 'w') as f:
-    json.dump(papers_data, f, indent=4)
 
-print("Papers data updated with abstracts.")
+if __name__ == "__main__":
+    main()
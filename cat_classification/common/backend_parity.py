@@ -0,0 +1,105 @@
+"""
+Accuracy-parity check and benchmark of the int8 embedding backend against fp32.
+
+Both backends embed the same abstracts (without the embedding cache) in this process, timed after a warm-up batch.
+Parity is checked in two ways:
+    - the cosine similarity between the fp32 and the int8 embedding of every abstract
+    - the categories assigned to held-out papers (a seeded random 20% of the dataset, as in the first fold of the
+      k-fold script, categorised against the rest) at each threshold, as the embedder would
+The check fails (exit code 1) when the lowest cosine is below --min-cosine or when more than --max-mismatch of the
+held-out papers get different categories at any threshold.
+
+Usage: python backend_parity.py [--input ../../abstract_adding/updated_papers_data.json] [--limit N]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import model_registry
+from categorization import CategoryIndicator, categorize, normalise_rows
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+
+PAPERS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'abstract_adding',
+                           'updated_papers_data.json')
+
+THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9]
+
+
+def timed_encode(backend, texts, batch_size):
+    """
+    Embed texts with one backend, after a warm-up batch.
+    :return: Tuple of (embeddings, texts per second)
+    """
+    model_registry.configure(backend=backend)
+    model_registry.encode(MODEL_NAME, texts[:batch_size], batch_size=batch_size)
+    start = time.time()
+    embeddings = np.asarray(model_registry.encode(MODEL_NAME, texts, batch_size=batch_size), dtype=np.float32)
+    return embeddings, len(texts) / max(time.time() - start, 1e-9)
+
+
+def category_mismatch(reference, candidate, categories, thresholds=THRESHOLDS, holdout=0.2, seed=42):
+    """
+    Categorise a random `holdout` share of the papers against the others with both sets of embeddings.
+    The papers are shuffled with `seed` first, so the held-out papers are spread over the dataset and its categories
+    instead of being the last entries of the file.
+    :return: Dictionary mapping each threshold to the share of held-out papers whose categories differ
+    """
+    order = np.random.RandomState(seed).permutation(len(categories))
+    split = int(np.ceil(len(categories) * holdout))
+    held_out, known = order[:split], order[split:]
+    indicator = CategoryIndicator([categories[i] for i in known])
+    expected = categorize(reference[held_out], reference[known], indicator, thresholds)
+    actual = categorize(candidate[held_out], candidate[known], indicator, thresholds)
+    return {threshold: float(np.mean([set(a) != set(b) for a, b in zip(expected.categories(threshold),
+                                                                       actual.categories(threshold))]))
+            for threshold in thresholds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the int8 embedding backend with fp32")
+    parser.add_argument('--input', default=PAPERS_FILE, help="Labelled papers with abstracts")
+    parser.add_argument('--limit', type=int, help="Only use the first N papers")
+    parser.add_argument('--batch-size', type=int, default=32, help="Texts per batch (default: 32)")
+    parser.add_argument('--min-cosine', type=float, default=0.98,
+                        help="Lowest allowed fp32/int8 cosine of an abstract (default: 0.98)")
+    parser.add_argument('--max-mismatch', type=float, default=0.05,
+                        help="Highest allowed share of held-out papers with different categories (default: 0.05)")
+    args = parser.parse_args()
+
+    with open(args.input, 'r') as f:
+        papers = [paper for paper in json.load(f) if paper.get('abstract', "Abstract not found") != "Abstract not found"]
+    papers = papers[:args.limit]
+    texts = [paper['abstract'] for paper in papers]
+    categories = [paper['category'] if isinstance(paper['category'], list) else [paper['category']]
+                  for paper in papers]
+    print(f"Embedding {len(texts)} abstracts with {MODEL_NAME}")
+
+    fp32, fp32_speed = timed_encode('fp32', texts, args.batch_size)
+    int8, int8_speed = timed_encode('int8', texts, args.batch_size)
+    print(f"fp32: {fp32_speed:8.1f} texts/s")
+    print(f"int8: {int8_speed:8.1f} texts/s  ({int8_speed / fp32_speed:.2f}x)")
+
+    cosines = np.sum(normalise_rows(fp32) * normalise_rows(int8), axis=1)
+    print(f"fp32/int8 cosine: min {cosines.min():.4f}, mean {cosines.mean():.4f}")
+    mismatch = category_mismatch(fp32, int8, categories)
+    for threshold, share in mismatch.items():
+        print(f"Threshold {threshold}: {share:.1%} of held-out papers categorised differently")
+
+    failures = []
+    if cosines.min() < args.min_cosine:
+        failures.append(f"lowest cosine {cosines.min():.4f} is below {args.min_cosine}")
+    failures += [f"{share:.1%} of papers change category at threshold {threshold}"
+                 for threshold, share in mismatch.items() if share > args.max_mismatch]
+    if failures:
+        print("Parity check failed: " + "; ".join(failures))
+        sys.exit(1)
+    print("Parity check passed")
+
+
+if __name__ == "__main__":
+    main()
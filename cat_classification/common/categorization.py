@@ -0,0 +1,158 @@
+"""
+Vectorised similarity-based categorisation.
+
+A new paper gets every category of the reference papers it is more similar to than a threshold. Instead of looping
+over every (new, reference) pair once per threshold, the reference categories are turned into a sparse
+reference x category indicator matrix once, and for each threshold `(similarity > threshold) @ indicator` counts,
+for every new paper and category, the reference papers supporting it. The maximum similarity to any reference
+paper of a category is returned as the confidence of that category: a category is assigned at threshold t exactly
+when its confidence is above t.
+
+Similarities are computed as float32 dot products of normalised embeddings, one tile of new papers x reference
+papers at a time, so the full similarity matrix never exists. The tile size follows a memory budget (default
+256 MB) that covers the tile and the per-paper arrays of a block (embeddings, confidences and support counts), and
+BlockedCategorizer.iter_categorize yields the results of each block of new papers as soon as it is done, so callers
+can write them out and keep memory constant however many papers are categorised.
+"""
+import numpy as np
+from scipy import sparse
+
+UNCLASSIFIED = 'Unclassified'
+
+MEMORY_BUDGET = 256 * 1024 * 1024
+
+# Reference papers per tile
+COLUMN_BLOCK_SIZE = 16384
+
+# New papers per block, whatever the budget allows: callers also hold the block's papers (e.g. a DataFrame)
+ROW_BLOCK_SIZE = 8192
+
+# Bytes per cell of a tile: the float32 similarities, the float32 mask of one threshold and the gathered
+# similarities of one category
+BYTES_PER_CELL = 12
+
+
+def normalise_rows(embeddings):
+    """L2-normalise the rows of a matrix as float32. Zero rows stay zero, as in sklearn's cosine_similarity."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return embeddings / norms
+
+
+class CategoryIndicator:
+    def __init__(self, categories):
+        """
+        :param categories: List with the list of categories of each reference paper
+        """
+        self.labels = sorted({category for paper_categories in categories for category in paper_categories})
+        columns = {label: i for i, label in enumerate(self.labels)}
+        rows = [i for i, paper_categories in enumerate(categories) for _ in set(paper_categories)]
+        cols = [columns[category] for paper_categories in categories for category in set(paper_categories)]
+        # Reference papers x categories, 1 where the paper has the category
+        self.matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                                        shape=(len(categories), len(self.labels)))
+        # Reference papers of each category, for the per-category maximum
+        csc = self.matrix.tocsc()
+        self.members = [csc.indices[csc.indptr[i]:csc.indptr[i + 1]] for i in range(len(self.labels))]
+
+
+class CategorizationResult:
+    def __init__(self, labels, confidence, support):
+        """
+        :param labels: Category names, the columns of confidence and support
+        :param confidence: new papers x categories array, maximum similarity to a reference paper of the category
+        :param support: Dictionary mapping each threshold to a new papers x categories array counting the reference
+                        papers of the category above the threshold
+        """
+        self.labels = labels
+        self.confidence = confidence
+        self.support = support
+
+    def categories(self, threshold):
+        """
+        :return: List of categories for each new paper. Contains 'Unclassified' if no category is assigned
+        """
+        assigned = self.support[threshold] > 0
+        return [[self.labels[i] for i in np.flatnonzero(row)] or [UNCLASSIFIED] for row in assigned]
+
+    def confidences(self, index):
+        """Dictionary mapping category to confidence for one new paper"""
+        return {label: float(value) for label, value in zip(self.labels, self.confidence[index])}
+
+
+def block_shape(n_columns, memory_budget=MEMORY_BUDGET, dimension=0, n_categories=0, n_thresholds=1):
+    """
+    :param dimension: Embedding size; a block holds the embeddings of its new papers and their normalised copy
+    :param n_categories: Categories of the reference papers; a block holds a float32 confidence and an int64
+                         support count per threshold for each new paper and category
+    :return: Tuple of (new papers, reference papers) per tile that fits in the memory budget
+    """
+    columns = max(1, min(n_columns, COLUMN_BLOCK_SIZE))
+    bytes_per_row = columns * BYTES_PER_CELL + dimension * 8 + n_categories * (4 + 8 * n_thresholds)
+    return max(1, min(memory_budget // bytes_per_row, ROW_BLOCK_SIZE)), columns
+
+
+class BlockedCategorizer:
+    def __init__(self, existing_embeddings, indicator, thresholds, memory_budget=MEMORY_BUDGET):
+        """
+        :param existing_embeddings: Embeddings of the reference papers
+        :param indicator: CategoryIndicator of the reference papers (in the order of existing_embeddings)
+        :param thresholds: Iterable of similarity thresholds
+        :param memory_budget: Bytes a tile may use
+        """
+        self.existing = normalise_rows(existing_embeddings)
+        self.indicator = indicator
+        self.thresholds = list(thresholds)
+        self.rows, columns = block_shape(len(self.existing), memory_budget, self.existing.shape[1],
+                                         len(indicator.labels), len(self.thresholds))
+        # For each column block: its range, its rows of the indicator and the members of each category within it
+        self.column_blocks = []
+        for start in range(0, len(self.existing), columns):
+            end = min(start + columns, len(self.existing))
+            members = [m[np.searchsorted(m, start):np.searchsorted(m, end)] - start for m in indicator.members]
+            self.column_blocks.append((start, end, indicator.matrix[start:end].T.tocsr(), members))
+
+    def iter_categorize(self, new_embeddings):
+        """
+        Categorise new papers one block of `rows` papers at a time.
+        :return: Generator of (index of the first paper of the block, CategorizationResult of the block)
+        """
+        for start in range(0, len(new_embeddings), self.rows):
+            yield start, self._categorize_block(normalise_rows(new_embeddings[start:start + self.rows]))
+
+    def categorize(self, new_embeddings):
+        """:return: CategorizationResult of all new papers"""
+        blocks = [result for _, result in self.iter_categorize(new_embeddings)]
+        if not blocks:
+            return self._categorize_block(np.empty((0, self.existing.shape[1]), dtype=np.float32))
+        return CategorizationResult(self.indicator.labels,
+                                    np.concatenate([result.confidence for result in blocks]),
+                                    {threshold: np.concatenate([result.support[threshold] for result in blocks])
+                                     for threshold in self.thresholds})
+
+    def _categorize_block(self, new_block):
+        labels = self.indicator.labels
+        confidence = np.full((len(new_block), len(labels)), -1.0, dtype=np.float32)
+        support = {threshold: np.zeros((len(new_block), len(labels)), dtype=np.int64) for threshold in self.thresholds}
+        for start, end, indicator_t, members in self.column_blocks:
+            similarities = new_block @ self.existing[start:end].T
+            for threshold in self.thresholds:
+                # categories x reference papers @ reference papers x new papers: scipy does a sparse x dense product
+                counts = indicator_t @ (similarities > threshold).T.astype(np.float32)
+                support[threshold] += np.rint(np.asarray(counts).T).astype(np.int64)
+            for i, category_members in enumerate(members):
+                if len(category_members) and len(new_block):
+                    np.maximum(confidence[:, i], similarities[:, category_members].max(axis=1), out=confidence[:, i])
+        return CategorizationResult(labels, confidence, support)
+
+
+def categorize(new_embeddings, existing_embeddings, indicator, thresholds, memory_budget=MEMORY_BUDGET):
+    """
+    Categorise new papers for several thresholds in one pass over the similarities.
+    :param indicator: CategoryIndicator of the reference papers (in the order of existing_embeddings)
+    :param thresholds: Iterable of similarity thresholds
+    :param memory_budget: Bytes a tile of the similarity matrix may use
+    :return: CategorizationResult
+    """
+    return BlockedCategorizer(existing_embeddings, indicator, thresholds, memory_budget).categorize(new_embeddings)
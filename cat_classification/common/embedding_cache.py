@@ -0,0 +1,178 @@
+"""
+On-disk cache of sentence embeddings, so the reference corpus is not re-encoded on every run.
+
+Embeddings are keyed by the model name plus a hash of the normalised text (whitespace collapsed), so the same
+abstract with different line breaks hits the same entry. Each model has its own directory:
+
+    <cache dir>/<model>/vectors-<generation>.npy    float32 matrix, one row per entry, read memory-mapped
+    <cache dir>/<model>/index.json                  model version, generation of the vectors file, and for every
+                                                    key its row and when it was last used
+
+Every save writes a new vectors file and then atomically replaces index.json, which is the only pointer to it, so
+an interrupted save leaves the previous index and vectors in place. Vectors files of other generations are removed
+after the switch.
+
+The model version (e.g. the sentence-transformers version) is recorded with the entries. Opening the cache with a
+different version discards them, as the vectors of another version can't be compared with new ones.
+At most `max_entries` entries are kept; on save the least recently used ones are evicted.
+
+The cache directory defaults to cat_classification/cache/embeddings; set EMBEDDING_CACHE_DIR to move it.
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+CACHE_DIR = os.environ.get('EMBEDDING_CACHE_DIR',
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache', 'embeddings'))
+
+# 50,000 entries of a 384-dimensional model take about 75 MB
+MAX_ENTRIES = 50000
+
+
+def normalise_text(text):
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def text_key(model_name, text):
+    """Cache key of a text: hash of the model name and the normalised text"""
+    return hashlib.sha256(f"{model_name}\0{normalise_text(text)}".encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, model_name, model_version, directory=CACHE_DIR, max_entries=MAX_ENTRIES):
+        self.model_name = model_name
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.directory = os.path.join(directory, re.sub(r'[^\w.-]', '_', model_name))
+        self.index_file = os.path.join(self.directory, 'index.json')
+        # Generation of the vectors file the index points to
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        # key -> [row in the vectors file, last used (unix time)]
+        self.index = {}
+        self.vectors = None
+        # Entries encoded during this run, written by save()
+        self.pending = {}
+        self._load()
+
+    def vectors_file(self, generation):
+        return os.path.join(self.directory, f'vectors-{generation}.npy')
+
+    def _load(self):
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, 'r') as f:
+                stored = json.load(f)
+            vectors = np.load(self.vectors_file(stored['generation']), mmap_mode='r')
+        except (ValueError, KeyError, OSError) as e:
+            print(f"Ignoring unreadable embedding cache in {self.directory}: {str(e)}")
+            return
+        if stored.get('model_version') != self.model_version:
+            print(f"Embedding cache was written by {self.model_name} {stored.get('model_version')}, "
+                  f"not {self.model_version}; discarding it")
+            return
+        if stored.get('rows') != len(vectors):
+            print(f"Embedding cache in {self.directory} is inconsistent; discarding it")
+            return
+        self.index = stored['entries']
+        self.vectors = vectors
+        self.generation = stored['generation']
+
+    def __len__(self):
+        return len(self.index) + len(self.pending)
+
+    def get(self, key):
+        """Return the cached embedding of a key, or None"""
+        if key in self.pending:
+            return self.pending[key]
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        entry[1] = time.time()
+        return np.asarray(self.vectors[entry[0]])
+
+    def put(self, key, vector):
+        self.pending[key] = np.asarray(vector, dtype=np.float32)
+
+    def encode(self, texts, encoder):
+        """
+        Embed texts, calling the encoder only for the texts that are not cached yet.
+        :param texts: List of texts
+        :param encoder: Function mapping a list of texts to a 2-D array of embeddings
+        :return: Numpy array of embeddings, one row per text, in input order
+        """
+        keys = [text_key(self.model_name, text) for text in texts]
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self.pending and key not in self.index and key not in missing:
+                missing[key] = text
+        self.misses += len(missing)
+        self.hits += len(set(keys)) - len(missing)
+        if missing:
+            for key, vector in zip(missing, encoder(list(missing.values()))):
+                self.put(key, vector)
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([self.get(key) for key in keys])
+
+    def save(self):
+        """
+        Write the entries encoded during this run, evicting the least recently used entries above max_entries.
+        The vectors go to a new file; replacing the index switches to it atomically.
+        """
+        if not self.pending:
+            # Only the last-used times changed
+            if self.index:
+                self._write_index(self.index, self.generation)
+            return
+        now = time.time()
+        entries = [(key, row, used) for key, (row, used) in self.index.items()]
+        entries.sort(key=lambda entry: entry[2], reverse=True)
+        # New entries are the most recently used, so they are kept first
+        keep_old = entries[:max(self.max_entries - len(self.pending), 0)]
+        new_keys = list(self.pending)[:self.max_entries]
+        evicted = len(entries) - len(keep_old) + len(self.pending) - len(new_keys)
+
+        dimension = len(next(iter(self.pending.values())))
+        os.makedirs(self.directory, exist_ok=True)
+        generation = self.generation + 1
+        out = np.lib.format.open_memmap(self.vectors_file(generation), mode='w+', dtype=np.float32,
+                                        shape=(len(keep_old) + len(new_keys), dimension))
+        if keep_old:
+            out[:len(keep_old)] = self.vectors[[row for _, row, _ in keep_old]]
+        for i, key in enumerate(new_keys):
+            out[len(keep_old) + i] = self.pending[key]
+        out.flush()
+        del out
+
+        index = {key: [i, used] for i, (key, _, used) in enumerate(keep_old)}
+        index.update({key: [len(keep_old) + i, now] for i, key in enumerate(new_keys)})
+        self._write_index(index, generation)
+
+        self.index = index
+        self.generation = generation
+        self.vectors = np.load(self.vectors_file(generation), mmap_mode='r')
+        self.pending = {}
+        # Earlier generations, and files of saves that were interrupted before their index was written
+        for path in glob.glob(os.path.join(self.directory, 'vectors-*.npy')):
+            if path != self.vectors_file(generation):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        if evicted:
+            print(f"Evicted {evicted} embeddings from the cache (limit {self.max_entries})")
+
+    def _write_index(self, index, generation):
+        tmp_index = self.index_file + '.tmp'
+        with open(tmp_index, 'w') as f:
+            json.dump({'model': self.model_name, 'model_version': self.model_version, 'generation': generation,
+                       'rows': len(index), 'entries': index}, f)
+        os.replace(tmp_index, self.index_file)
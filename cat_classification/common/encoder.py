@@ -0,0 +1,102 @@
+"""
+Batch encoding of many texts, for embedding large sets of abstracts.
+
+Texts are sorted by length and cut into batches of similar length, so little compute is spent on padding. With more
+than one worker, the batches are sent to a pool of worker processes, each with its own copy of the model (loaded once
+through model_registry) and its share of the CPU cores as torch threads. The longest batches go first and idle
+workers take the next one, so the workers finish close together. Embeddings come back in the order of the texts,
+and the throughput is printed after every call.
+
+Settings, from the environment or model_registry.configure():
+    EMBEDDING_WORKERS       worker processes; default 1 (encode in this process)
+    EMBEDDING_BATCH_SIZE    texts per batch; default 32
+"""
+import atexit
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import model_registry
+
+_pool = None
+_pool_key = None
+
+
+def length_batches(texts, batch_size):
+    """
+    Group texts of similar length.
+    :return: List of lists of text positions, longest texts first
+    """
+    # Words are a cheap stand-in for tokens
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i].split()), reverse=True)
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def _init_worker(settings):
+    model_registry.configure(**settings)
+
+
+def _encode_batch(name, texts):
+    return np.asarray(model_registry.encode(name, texts, batch_size=len(texts)), dtype=np.float32)
+
+
+def _get_pool(workers):
+    global _pool, _pool_key
+    threads = model_registry.settings['threads'] or max(1, (os.cpu_count() or 1) // workers)
+    key = (workers, model_registry.settings['device'], threads, model_registry.settings['backend'])
+    if _pool is None or _pool_key != key:
+        shutdown()
+        # Spawned, not forked: forking a process that already runs torch threads can deadlock
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                    initializer=_init_worker,
+                                    initargs=({'device': model_registry.settings['device'], 'threads': threads,
+                                               'backend': model_registry.settings['backend']},))
+        _pool_key = key
+    return _pool
+
+
+def shutdown():
+    """Stop the worker processes, if any"""
+    global _pool, _pool_key
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+        _pool_key = None
+
+
+atexit.register(shutdown)
+
+
+def encode(name, texts, batch_size=None, workers=None):
+    """
+    Embed texts with a model of the registry, in length-sorted batches, over `workers` processes.
+    :param batch_size: Texts per batch; default: model_registry.settings['batch_size']
+    :param workers: Worker processes; default: model_registry.settings['workers']
+    :return: Numpy array of embeddings, one row per text, in input order
+    """
+    batch_size = batch_size or model_registry.settings['batch_size']
+    workers = workers or model_registry.settings['workers']
+    texts = list(texts)
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+
+    start = time.time()
+    batches = length_batches(texts, batch_size)
+    if workers > 1 and len(batches) > 1:
+        pool = _get_pool(workers)
+        futures = [pool.submit(_encode_batch, name, [texts[i] for i in batch]) for batch in batches]
+        results = [future.result() for future in futures]
+    else:
+        workers = 1
+        results = [_encode_batch(name, [texts[i] for i in batch]) for batch in batches]
+
+    embeddings = np.empty((len(texts), results[0].shape[1]), dtype=np.float32)
+    for batch, result in zip(batches, results):
+        embeddings[batch] = result
+    seconds = time.time() - start
+    print(f"Encoded {len(texts)} texts in {seconds:.1f}s ({len(texts) / max(seconds, 1e-9):.1f} texts/s, "
+          f"{workers} worker{'s' if workers > 1 else ''}, batch size {batch_size})")
+    return embeddings
@@ -0,0 +1,96 @@
+"""
+Process-wide registry of SentenceTransformer models.
+
+Every model is loaded once, on first use, and then shared by all callers in the process, so scripts that embed
+several lists of texts (e.g. once per cross-validation fold) don't read the weights and initialise torch each time.
+sentence-transformers (and torch) are only imported when the first model is loaded.
+
+Settings, from the environment or configure():
+    EMBEDDING_DEVICE        device to load models on (cpu, cuda, mps, ...); default: chosen by sentence-transformers
+    EMBEDDING_THREADS       torch CPU threads; default: torch's default
+    EMBEDDING_BATCH_SIZE    texts per encoding batch; default 32
+    EMBEDDING_WORKERS       worker processes used by encoder.encode; default 1
+    EMBEDDING_BACKEND       fp32 (default) or int8: the model's linear layers quantised with torch dynamic int8
+                            quantisation, faster on CPU. Check it with backend_parity.py before switching.
+"""
+import os
+import threading
+
+settings = {
+    'device': os.environ.get('EMBEDDING_DEVICE') or None,
+    'threads': int(os.environ['EMBEDDING_THREADS']) if os.environ.get('EMBEDDING_THREADS') else None,
+    'batch_size': int(os.environ.get('EMBEDDING_BATCH_SIZE', 32)),
+    'workers': int(os.environ.get('EMBEDDING_WORKERS', 1)),
+    'backend': os.environ.get('EMBEDDING_BACKEND', 'fp32'),
+}
+
+BACKENDS = ('fp32', 'int8')
+
+_models = {}
+_lock = threading.Lock()
+
+
+def configure(device=None, threads=None, batch_size=None, workers=None, backend=None):
+    """
+    Override the settings read from the environment. device and threads only affect models loaded afterwards.
+    """
+    if backend is not None:
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}', expected one of: {', '.join(BACKENDS)}")
+        settings['backend'] = backend
+    if device is not None:
+        settings['device'] = device
+    if threads is not None:
+        settings['threads'] = threads
+    if batch_size is not None:
+        settings['batch_size'] = batch_size
+    if workers is not None:
+        settings['workers'] = workers
+
+
+def model_version():
+    """Version string recorded with cached embeddings"""
+    import sentence_transformers
+    return sentence_transformers.__version__
+
+
+def cache_name(name):
+    """Name to cache the embeddings of a model under. Quantised models get their own, as their embeddings differ."""
+    return name if settings['backend'] == 'fp32' else f"{name}-{settings['backend']}"
+
+
+def get_model(name):
+    """Return the shared instance of a model, loading it on first use"""
+    if settings['backend'] not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{settings['backend']}', expected one of: {', '.join(BACKENDS)}")
+    key = (name, settings['device'], settings['backend'])
+    with _lock:
+        if key not in _models:
+            # Imported here, so importing this module doesn't load torch
+            import torch
+            from sentence_transformers import SentenceTransformer
+
+            if settings['threads']:
+                torch.set_num_threads(settings['threads'])
+            print(f"Loading embedding model {name}" + (f" on {settings['device']}" if settings['device'] else "")
+                  + (f" ({settings['backend']})" if settings['backend'] != 'fp32' else ""))
+            model = SentenceTransformer(name, device=settings['device'])
+            if settings['backend'] == 'int8':
+                # int8 weights for the linear layers, activations quantised on the fly; CPU only
+                model = torch.quantization.quantize_dynamic(model.to('cpu'), {torch.nn.Linear}, dtype=torch.qint8)
+            _models[key] = model
+        return _models[key]
+
+
+def encode(name, texts, batch_size=None):
+    """
+    Embed texts with the shared instance of a model.
+    :return: Numpy array of embeddings
+    """
+    return get_model(name).encode(texts, batch_size=batch_size or settings['batch_size'])
+
+
+def clear():
+    """Drop all loaded models, e.g. to free memory"""
+    with _lock:
+        _models.clear()
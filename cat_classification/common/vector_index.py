@@ -0,0 +1,381 @@
+"""
+Vector indexes for similarity-based categorisation against large reference sets.
+
+All indexes store L2-normalised float32 vectors, so inner products are cosine similarities, together with the
+categories and a key (e.g. embedding_cache.text_key) of every reference paper. Adding a key that is already indexed
+only updates its categories, so an index can be kept on disk and topped up with the new reference papers of each run.
+
+Backends:
+    brute   exact search over all vectors, in blocks
+    ivf     inverted file: vectors are grouped around k-means centroids (trained on the first add, and retrained on
+            all vectors once the index outgrows them), and a query only scans the groups of its `n_probe` closest
+            centroids. Approximate; raise n_probe for better recall.
+    hnsw    HNSW graph from faiss (pip install faiss-cpu). Approximate; raise ef_search for better recall.
+
+    index = create_index('ivf', dimension=384)
+    index.add(embeddings, categories, keys)
+    index.save('index_dir')
+    ids, scores = load_index('index_dir').search(queries, k=10)
+"""
+import abc
+import json
+import os
+from collections import Counter
+
+import numpy as np
+
+from categorization import CategorizationResult, normalise_rows
+
+# Reference vectors scanned at once by exact search (32,768 x 384 float32 = 48 MB per block of queries)
+SEARCH_BLOCK_SIZE = 32768
+
+# An IVF index retrains its centroids once it holds more than RETRAIN_FACTOR * n_lists^2 vectors
+RETRAIN_FACTOR = 4
+
+
+def _top_k(scores, k):
+    """Indices and scores of the k highest scores of every row, best first"""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((len(scores), 0), dtype=np.int64), np.empty((len(scores), 0), dtype=np.float32)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def _pad(ids, scores, k):
+    """Pad results to k columns with id -1 and score -inf"""
+    missing = k - ids.shape[1]
+    if missing > 0:
+        ids = np.hstack([ids, np.full((len(ids), missing), -1, dtype=np.int64)])
+        scores = np.hstack([scores, np.full((len(scores), missing), -np.inf, dtype=np.float32)])
+    return ids, scores
+
+
+class VectorIndex(abc.ABC):
+    backend = None
+
+    def __init__(self, dimension):
+        self.dimension = dimension
+        self.keys = []
+        self.categories = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, vectors, categories, keys=None):
+        """
+        Add reference vectors. Vectors whose key is already indexed only get their categories updated.
+        :param vectors: 2-D array, one row per reference paper
+        :param categories: List with the list of categories of each reference paper
+        :param keys: Optional list of unique keys; default: the position in the index
+        :return: Number of vectors added
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if keys is None:
+            keys = [str(len(self.keys) + i) for i in range(len(vectors))]
+        new_rows = []
+        for row, (key, paper_categories) in enumerate(zip(keys, categories)):
+            if key in self.positions:
+                self.categories[self.positions[key]] = list(paper_categories)
+            else:
+                self.positions[key] = len(self.keys)
+                self.keys.append(key)
+                self.categories.append(list(paper_categories))
+                new_rows.append(row)
+        if new_rows:
+            self._add_vectors(normalise_rows(vectors[new_rows]))
+        return len(new_rows)
+
+    def search(self, queries, k=10):
+        """
+        Find the k most similar reference vectors of every query.
+        :return: Tuple of (ids, scores) arrays of shape queries x k, best first, padded with id -1 and score -inf
+        """
+        queries = normalise_rows(np.atleast_2d(queries))
+        ids, scores = self._search(queries, k)
+        return _pad(ids, scores, k)
+
+    def radius_search(self, queries, radius, k=None):
+        """
+        Find the reference vectors more similar than `radius` to every query. Approximate indexes only consider
+        the `k` nearest candidates (default 100).
+        :return: List of (ids, scores) arrays for each query, best first
+        """
+        ids, scores = self.search(queries, k or 100)
+        return [(row_ids[row_scores > radius], row_scores[row_scores > radius]) for row_ids, row_scores in
+                zip(ids, scores)]
+
+    def votes(self, queries, k=10, radius=None):
+        """
+        Category votes of the k nearest reference papers of every query (only those above `radius`, if given).
+        :return: List with a Counter mapping category to number of neighbours for each query
+        """
+        ids, scores = self.search(queries, k)
+        votes = []
+        for row_ids, row_scores in zip(ids, scores):
+            counter = Counter()
+            for i, score in zip(row_ids, row_scores):
+                if i >= 0 and (radius is None or score > radius):
+                    counter.update(self.categories[i])
+            votes.append(counter)
+        return votes
+
+    def categorize(self, queries, thresholds, k=10):
+        """
+        Categorise queries like categorization.categorize, using only their k nearest reference papers.
+        With the brute backend and k >= len(index) the result is exact.
+        :return: categorization.CategorizationResult
+        """
+        labels = sorted({category for paper_categories in self.categories for category in paper_categories})
+        columns = {label: i for i, label in enumerate(labels)}
+        ids, scores = self.search(queries, k)
+        confidence = np.full((len(ids), len(labels)), -1.0, dtype=np.float32)
+        support = {threshold: np.zeros((len(ids), len(labels)), dtype=np.int64) for threshold in thresholds}
+        for n, (row_ids, row_scores) in enumerate(zip(ids, scores)):
+            for i, score in zip(row_ids, row_scores):
+                if i < 0:
+                    continue
+                for category in set(self.categories[i]):
+                    c = columns[category]
+                    confidence[n, c] = max(confidence[n, c], score)
+                    for threshold in thresholds:
+                        if score > threshold:
+                            support[threshold][n, c] += 1
+        return CategorizationResult(labels, confidence, support)
+
+    def save(self, directory):
+        """Write the index to a directory, replacing the files of a previous save"""
+        os.makedirs(directory, exist_ok=True)
+        self._save_vectors(directory)
+        meta = {'backend': self.backend, 'dimension': self.dimension, 'params': self._params(),
+                'keys': self.keys, 'categories': self.categories}
+        tmp_file = os.path.join(directory, 'meta.json.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_file, os.path.join(directory, 'meta.json'))
+
+    def _restore(self, meta, directory):
+        self.keys = meta['keys']
+        self.categories = meta['categories']
+        self.positions = {key: i for i, key in enumerate(self.keys)}
+        self._load_vectors(directory)
+
+    def _params(self):
+        return {}
+
+    @abc.abstractmethod
+    def _add_vectors(self, vectors):
+        pass
+
+    @abc.abstractmethod
+    def _search(self, queries, k):
+        pass
+
+    @abc.abstractmethod
+    def _save_vectors(self, directory):
+        pass
+
+    @abc.abstractmethod
+    def _load_vectors(self, directory):
+        pass
+
+
+def _save_array(directory, name, array):
+    tmp_file = os.path.join(directory, name + '.tmp.npy')
+    np.save(tmp_file, array)
+    os.replace(tmp_file, os.path.join(directory, name + '.npy'))
+
+
+class BruteForceIndex(VectorIndex):
+    backend = 'brute'
+
+    def __init__(self, dimension):
+        super().__init__(dimension)
+        self.vectors = np.empty((0, dimension), dtype=np.float32)
+
+    def _add_vectors(self, vectors):
+        self.vectors = np.concatenate([self.vectors, vectors])
+
+    def _search(self, queries, k):
+        best_ids = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        # Keep the running top k while scanning the reference vectors block by block
+        for start in range(0, len(self.vectors), SEARCH_BLOCK_SIZE):
+            block_ids, block_scores = _top_k(queries @ self.vectors[start:start + SEARCH_BLOCK_SIZE].T, k)
+            ids, scores = _top_k(np.hstack([best_scores, block_scores]), k)
+            best_ids = np.take_along_axis(np.hstack([best_ids, block_ids + start]), ids, axis=1)
+            best_scores = scores
+        return best_ids, best_scores
+
+    def _save_vectors(self, directory):
+        _save_array(directory, 'vectors', self.vectors)
+
+    def _load_vectors(self, directory):
+        self.vectors = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r')
+
+
+def train_centroids(vectors, n_lists, iterations=10, sample_size=None, seed=0):
+    """Spherical k-means on (a sample of) normalised vectors. :return: n_lists x dimension array of centroids"""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), sample_size or n_lists * 64)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        # Empty lists keep their centroid
+        filled = np.bincount(assignment, minlength=n_lists) > 0
+        centroids[filled] = normalise_rows(sums[filled])
+    return centroids
+
+
+def _nearest(vectors, centroids, block_size=SEARCH_BLOCK_SIZE):
+    return np.concatenate([np.argmax(vectors[start:start + block_size] @ centroids.T, axis=1)
+                           for start in range(0, len(vectors), block_size)] or [np.empty(0, dtype=np.int64)])
+
+
+class IVFIndex(VectorIndex):
+    backend = 'ivf'
+
+    def __init__(self, dimension, n_lists=None, n_probe=8):
+        """
+        :param n_lists: Number of k-means centroids; default: 4 * sqrt of the size of the first add
+        :param n_probe: Number of closest lists scanned per query
+        """
+        super().__init__(dimension)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.vectors = np.empty((0, dimension), dtype=np.float32)
+        self.centroids = None
+        self.assignment = np.empty(0, dtype=np.int64)
+        self.lists = []
+
+    def _add_vectors(self, vectors):
+        start = len(self.vectors)
+        self.vectors = np.concatenate([self.vectors, vectors])
+        if self.centroids is None:
+            n_lists = min(self.n_lists or max(int(4 * np.sqrt(len(vectors))), 1), len(vectors))
+            self.centroids = train_centroids(vectors, n_lists)
+            self.n_lists = n_lists
+        elif len(self.vectors) > RETRAIN_FACTOR * len(self.centroids) ** 2:
+            # Centroids trained on a much smaller index no longer split it into even lists
+            print(f"IVF index grew to {len(self.vectors)} vectors over {len(self.centroids)} lists; retraining it")
+            self.retrain()
+            return
+        assignment = _nearest(vectors, self.centroids)
+        self.assignment = np.concatenate([self.assignment, assignment])
+        self._build_lists()
+
+    def _build_lists(self):
+        order = np.argsort(self.assignment, kind='stable')
+        bounds = np.searchsorted(self.assignment[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+
+    def retrain(self):
+        """Retrain the centroids on all vectors. Adds do this by themselves once the index outgrows its lists."""
+        self.n_lists = max(int(4 * np.sqrt(len(self.vectors))), 1)
+        self.centroids = train_centroids(self.vectors, min(self.n_lists, len(self.vectors)))
+        self.assignment = _nearest(self.vectors, self.centroids)
+        self._build_lists()
+
+    def _search(self, queries, k):
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        if self.centroids is None:
+            return ids, scores
+        n_probe = min(self.n_probe, len(self.centroids))
+        probes = _top_k(queries @ self.centroids.T, n_probe)[0]
+        for n, query in enumerate(queries):
+            candidates = np.concatenate([self.lists[i] for i in probes[n]])
+            top, top_scores = _top_k((self.vectors[candidates] @ query)[np.newaxis], k)
+            ids[n, :top.shape[1]] = candidates[top[0]]
+            scores[n, :top.shape[1]] = top_scores[0]
+        return ids, scores
+
+    def _params(self):
+        return {'n_lists': self.n_lists, 'n_probe': self.n_probe}
+
+    def _save_vectors(self, directory):
+        _save_array(directory, 'vectors', self.vectors)
+        if self.centroids is not None:
+            _save_array(directory, 'centroids', self.centroids)
+            _save_array(directory, 'assignment', self.assignment)
+
+    def _load_vectors(self, directory):
+        self.vectors = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r')
+        if os.path.exists(os.path.join(directory, 'centroids.npy')):
+            self.centroids = np.load(os.path.join(directory, 'centroids.npy'))
+            self.assignment = np.load(os.path.join(directory, 'assignment.npy'))
+            self._build_lists()
+
+
+class HNSWIndex(VectorIndex):
+    backend = 'hnsw'
+
+    def __init__(self, dimension, m=32, ef_construction=200, ef_search=128):
+        # Imported here, so the other backends work without faiss
+        import faiss
+
+        super().__init__(dimension)
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.index = faiss.IndexHNSWFlat(dimension, m, faiss.METRIC_INNER_PRODUCT)
+        self.index.hnsw.efConstruction = ef_construction
+        self.index.hnsw.efSearch = ef_search
+
+    def _add_vectors(self, vectors):
+        self.index.add(vectors)
+
+    def _search(self, queries, k):
+        scores, ids = self.index.search(queries, k)
+        return ids.astype(np.int64), scores.astype(np.float32)
+
+    def _params(self):
+        return {'m': self.m, 'ef_construction': self.ef_construction, 'ef_search': self.ef_search}
+
+    def _save_vectors(self, directory):
+        import faiss
+
+        tmp_file = os.path.join(directory, 'index.faiss.tmp')
+        faiss.write_index(self.index, tmp_file)
+        os.replace(tmp_file, os.path.join(directory, 'index.faiss'))
+
+    def _load_vectors(self, directory):
+        import faiss
+
+        self.index = faiss.read_index(os.path.join(directory, 'index.faiss'))
+        self.index.hnsw.efSearch = self.ef_search
+
+
+BACKENDS = {'brute': BruteForceIndex, 'ivf': IVFIndex, 'hnsw': HNSWIndex}
+
+
+def create_index(backend, dimension, **params):
+    """Create an empty index of one of the BACKENDS"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown index backend '{backend}', expected one of: {', '.join(BACKENDS)}")
+    return BACKENDS[backend](dimension, **params)
+
+
+def load_index(directory):
+    """Load an index written by VectorIndex.save"""
+    with open(os.path.join(directory, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    index = create_index(meta['backend'], meta['dimension'], **meta['params'])
+    index._restore(meta, directory)
+    return index
+
+
+def open_index(directory, backend, dimension, **params):
+    """Load the index in `directory` if there is one with the same backend, otherwise create an empty one"""
+    if os.path.exists(os.path.join(directory, 'meta.json')):
+        index = load_index(directory)
+        if index.backend == backend and index.dimension == dimension:
+            return index
+        print(f"Index in {directory} is a {index.backend} index of dimension {index.dimension}; rebuilding it")
+    return create_index(backend, dimension, **params)
@@ -1,7 +1,20 @@
+import argparse
 import pandas as pd
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import encoder  # noqa: E402
+import model_registry  # noqa: E402
+from categorization import (MEMORY_BUDGET, ROW_BLOCK_SIZE, BlockedCategorizer, CategoryIndicator,  # noqa: E402
+                            categorize)
+from embedding_cache import EmbeddingCache, text_key  # noqa: E402
+from vector_index import BACKENDS, open_index  # noqa: E402
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+
+INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache', 'index')
 
 
 # Load existing papers data
@@ -29,25 +42,32 @@ def load_existing_papers(file_path):
 
 
 # Load new papers from CSV
-def load_new_papers(file_path):
+def load_new_papers(file_path, chunksize=None):
     """
     Load new papers from a CSV file
     :param file_path: Path to the CSV file.
-    :return: DataFrame containing new papers data
+    :param chunksize: If given, read the file in DataFrames of this many rows
+    :return: DataFrame containing new papers data, or an iterator of DataFrames with chunksize
     """
     print(f"Loading new papers from {file_path}")
-    return pd.read_csv(file_path)
+    return pd.read_csv(file_path, chunksize=chunksize)
 
 
 # Generate embeddings
-def generate_embeddings(texts):
+def generate_embeddings(texts, cache=None):
     """
     Generate embeddings for a list of texts
     :param texts: List of texts
+    :param cache: Optional EmbeddingCache. Only the texts it doesn't hold yet are encoded.
     :return: Numpy array of embeddings
     """
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    return model.encode(texts)
+    def encode(missing_texts):
+        # The model is loaded once per process, and only if something needs encoding
+        return encoder.encode(MODEL_NAME, missing_texts)
+
+    if cache is None:
+        return encode(texts)
+    return cache.encode(texts, encode)
 
 
 # Calculate similarity and assign categories
@@ -61,53 +81,100 @@ def categorize_papers(new_embeddings, existing_embeddings, existing_categories,
     :param threshold: Threshold for similarity
     :return: List of categories for new papers. Contains 'Unclassified' if no category is assigned
     """
-    similarities = cosine_similarity(new_embeddings, existing_embeddings)
-    categories = []
-    for sim in similarities:
-        paper_categories = set()
-        for i, s in enumerate(sim):
-            if s > threshold:
-                paper_categories.update(existing_categories[i])
-        categories.append(list(paper_categories) if paper_categories else ['Unclassified'])
-    return categories
+    indicator = CategoryIndicator(existing_categories)
+    return categorize(new_embeddings, existing_embeddings, indicator, [threshold]).categories(threshold)
 
 
 # Main function
 def main():
+    parser = argparse.ArgumentParser(description="Categorize new papers by similarity to the labelled papers")
+    parser.add_argument('--index', choices=['dense'] + list(BACKENDS), default='dense',
+                        help="dense: compare with every known paper (default); brute, ivf, hnsw: use a persistent "
+                             "vector index and only the --top-k most similar known papers")
+    parser.add_argument('--index-dir', help="Directory of the vector index (default: ../cache/index/<model>/<backend>)")
+    parser.add_argument('--top-k', type=int, default=50, help="Neighbours per paper with --index (default: 50)")
+    parser.add_argument('--memory-budget', type=int, default=MEMORY_BUDGET // (1024 * 1024),
+                        help="MB a block of the similarity matrix may use (default: %(default)s)")
+    parser.add_argument('--workers', type=int, help="Processes encoding abstracts (default: EMBEDDING_WORKERS or 1)")
+    parser.add_argument('--batch-size', type=int, help="Abstracts per encoding batch (default: 32)")
+    parser.add_argument('--backend', choices=model_registry.BACKENDS,
+                        help="fp32 model or int8 quantised model (default: EMBEDDING_BACKEND or fp32)")
+    args = parser.parse_args()
+    model_registry.configure(batch_size=args.batch_size, workers=args.workers, backend=args.backend)
+
     # Load existing papers
     existing_papers = load_existing_papers('../../abstract_adding/updated_papers_data.json')
     print(f"Found {len(existing_papers)} existing papers")
 
+    # Keep the papers with an abstract, so that abstracts, categories and embeddings line up
+    existing_papers = [paper for paper in existing_papers
+                       if paper.get('abstract', "Abstract not found") != "Abstract not found"]
+
     # Extract abstracts and categories from existing papers
-    existing_abstracts = [paper['abstract'] for paper in existing_papers
-                          if paper['abstract'] != "Abstract not found"]
+    existing_abstracts = [paper['abstract'] for paper in existing_papers]
     print(f"Found {len(existing_abstracts)} existing abstracts")
 
     existing_categories = [paper['category'] if isinstance(paper['category'], list) else [paper['category']] for paper
                            in existing_papers]
     print(f"Found {len(existing_categories)} existing categories")
 
-    # Generate embeddings for existing papers
-    existing_embeddings = generate_embeddings(existing_abstracts)
+    # Generate embeddings for existing papers. They are cached on disk, so only new or changed abstracts are encoded.
+    cache = EmbeddingCache(model_registry.cache_name(MODEL_NAME), model_registry.model_version())
+    existing_embeddings = generate_embeddings(existing_abstracts, cache)
 
-    # Load new papers
-    new_papers = load_new_papers('../data/copy_new_arxiv_papers_20240903_170512.csv')
-    print(f"Found {len(new_papers)} new papers")
-
-    # Generate embeddings for new papers
-    new_embeddings = generate_embeddings(new_papers['Abstract'].tolist())
-
-    # Categorize new papers for different thresholds
+    # Categorize new papers for different thresholds, all in one pass over the similarities.
+    # New papers are read, embedded, categorized and written one block at a time, so memory use doesn't grow with
+    # the number of new papers.
     thresholds = [0.5, 0.6, 0.7, 0.8, 0.9]
-
-    for threshold in thresholds:
-        new_categories = categorize_papers(new_embeddings, existing_embeddings, existing_categories, threshold)
-        new_papers[f'Categories_{threshold}'] = new_categories
-        print(f"Number of unclassified papers (threshold {threshold}): {new_categories.count(['Unclassified'])}")
-
-    # Save results
+    if args.index == 'dense':
+        categorizer = BlockedCategorizer(existing_embeddings, CategoryIndicator(existing_categories), thresholds,
+                                         memory_budget=args.memory_budget * 1024 * 1024)
+        block_rows = categorizer.rows
+    else:
+        # Known papers are keyed by their abstract, so only new ones are added to the saved index
+        index_dir = args.index_dir or os.path.join(INDEX_DIR, model_registry.cache_name(MODEL_NAME), args.index)
+        index = open_index(index_dir, args.index, existing_embeddings.shape[1])
+        added = index.add(existing_embeddings, existing_categories,
+                          [text_key(MODEL_NAME, abstract) for abstract in existing_abstracts])
+        index.save(index_dir)
+        print(f"Added {added} papers to the {args.index} index ({len(index)} papers) in {index_dir}")
+        block_rows = ROW_BLOCK_SIZE
+
+    new_papers_file = '../data/copy_new_arxiv_papers_20240903_170512.csv'
     out_file_name = "output/categorized_papers_multiple_thresholds.csv"
-    new_papers.to_csv(out_file_name, index=False)
+    tmp_file = out_file_name + '.tmp'
+    unclassified = {threshold: 0 for threshold in thresholds}
+    count = 0
+    for i, new_papers in enumerate(load_new_papers(new_papers_file, chunksize=block_rows)):
+        new_embeddings = generate_embeddings(new_papers['Abstract'].tolist(), cache)
+        if args.index == 'dense':
+            result = categorizer.categorize(new_embeddings)
+        else:
+            result = index.categorize(new_embeddings, thresholds, k=args.top_k)
+
+        for threshold in thresholds:
+            new_categories = result.categories(threshold)
+            new_papers[f'Categories_{threshold}'] = new_categories
+            unclassified[threshold] += new_categories.count(['Unclassified'])
+
+        # Highest similarity to a known paper of each category
+        new_papers['Category_Confidence'] = [json.dumps({category: round(value, 4) for category, value
+                                                         in result.confidences(j).items()})
+                                             for j in range(len(new_papers))]
+        new_papers.to_csv(tmp_file, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        count += len(new_papers)
+    if not count:
+        # No new papers: write just the header
+        columns = list(pd.read_csv(new_papers_file, nrows=0).columns)
+        pd.DataFrame(columns=columns + [f'Categories_{threshold}' for threshold in thresholds]
+                     + ['Category_Confidence']).to_csv(tmp_file, index=False)
+    os.replace(tmp_file, out_file_name)
+    cache.save()
+
+    print(f"Found {count} new papers")
+    print(f"Embedding cache: {cache.hits} hits, {cache.misses} encoded")
+    for threshold in thresholds:
+        print(f"Number of unclassified papers (threshold {threshold}): {unclassified[threshold]}")
     print(f"Categorization complete. Results saved to '{out_file_name}'")
 
 
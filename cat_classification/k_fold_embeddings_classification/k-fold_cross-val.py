@@ -1,17 +1,25 @@
 import json
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
 from sklearn.model_selection import KFold
 from sklearn.metrics import precision_recall_fscore_support, confusion_matrix
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.preprocessing import MultiLabelBinarizer
 from collections import Counter
 
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import encoder  # noqa: E402
+import model_registry  # noqa: E402
+from categorization import CategoryIndicator, categorize  # noqa: E402
+from embedding_cache import EmbeddingCache  # noqa: E402
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+
 """
 
 """
@@ -23,21 +31,19 @@ def load_existing_papers(file_path):
     return papers_data
 
 
-def generate_embeddings(texts):
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    return model.encode(texts)
+def generate_embeddings(texts, cache=None):
+    def encode(missing_texts):
+        # The model is loaded once per process, and only if something needs encoding
+        return encoder.encode(MODEL_NAME, missing_texts)
+
+    if cache is None:
+        return encode(texts)
+    return cache.encode(texts, encode)
 
 
 def categorize_papers(new_embeddings, existing_embeddings, existing_categories, threshold):
-    similarities = cosine_similarity(new_embeddings, existing_embeddings)
-    categories = []
-    for sim in similarities:
-        paper_categories = set()
-        for i, s in enumerate(sim):
-            if s > threshold:
-                paper_categories.update(existing_categories[i])
-        categories.append(list(paper_categories) if paper_categories else ['Unclassified'])
-    return categories
+    indicator = CategoryIndicator(existing_categories)
+    return categorize(new_embeddings, existing_embeddings, indicator, [threshold]).categories(threshold)
 
 
 def evaluate_performance(true_categories, predicted_categories):
@@ -50,7 +56,7 @@ def evaluate_performance(true_categories, predicted_categories):
     return precision, recall, f1, mlb.classes_
 
 
-def perform_cross_validation(abstracts, categories, n_splits=5, threshold=0.7):
+def perform_cross_validation(abstracts, categories, n_splits=5, threshold=0.7, cache=None):
     kf = KFold(n_splits=n_splits, shuffle=True, random_state=42)
 
     precisions, recalls, f1_scores = [], [], []
@@ -64,9 +70,9 @@ def perform_cross_validation(abstracts, categories, n_splits=5, threshold=0.7):
         test_abstracts = [abstracts[i] for i in test_index]
         test_categories = [categories[i] for i in test_index]
 
-        # Generate embeddings
-        train_embeddings = generate_embeddings(train_abstracts)
-        test_embeddings = generate_embeddings(test_abstracts)
+        # Generate embeddings. With a cache, every abstract is encoded at most once across all folds.
+        train_embeddings = generate_embeddings(train_abstracts, cache)
+        test_embeddings = generate_embeddings(test_abstracts, cache)
 
         # Categorize papers
         predicted_categories = categorize_papers(test_embeddings, train_embeddings, train_categories, threshold)
@@ -126,25 +132,36 @@ def main():
     existing_papers = load_existing_papers('../../abstract_adding/updated_papers_data.json')
     print(f"Found {len(existing_papers)} existing papers")
 
+    # Keep the papers with an abstract, so abstracts, categories and DataFrame rows all line up
+    existing_papers = [paper for paper in existing_papers
+                       if paper.get('abstract', "Abstract not found") != "Abstract not found"]
+    print(f"Found {len(existing_papers)} existing papers with an abstract")
+
     # Extract abstracts and categories from existing papers
-    abstracts = [paper['abstract'] for paper in existing_papers if paper['abstract'] != "Abstract not found"]
+    abstracts = [paper['abstract'] for paper in existing_papers]
     categories = [paper['category'] if isinstance(paper['category'], list) else [paper['category']] for paper in existing_papers]
 
     # Create a DataFrame from the existing papers
     df = pd.DataFrame(existing_papers)
 
     print(f"Performing 5-fold cross-validation...")
+    cache = EmbeddingCache(model_registry.cache_name(MODEL_NAME), model_registry.model_version())
     (precision_mean, precision_std, recall_mean, recall_std, f1_mean, f1_std,
-     true_categories, predicted_categories, fold_indices) = perform_cross_validation(abstracts, categories)
+     true_categories, predicted_categories, fold_indices) = perform_cross_validation(abstracts, categories,
+                                                                                     cache=cache)
+    cache.save()
+    print(f"Embedding cache: {cache.hits} hits, {cache.misses} encoded")
 
     print(f"\nOverall Results:")
     print(f"Precision: {precision_mean:.4f} (±{precision_std:.4f})")
     print(f"Recall: {recall_mean:.4f} (±{recall_std:.4f})")
     print(f"F1-score: {f1_mean:.4f} (±{f1_std:.4f})")
 
-    # Add predicted categories and fold information to the DataFrame
-    df['Predicted_Categories'] = [','.join(cats) for cats in predicted_categories]
-    df['Cross_Validation_Fold'] = [fold for fold, _ in fold_indices]
+    # Add predicted categories and fold information to the DataFrame. They come in fold order, so they are put
+    # back at the row of their paper.
+    df['Predicted_Categories'] = pd.Series([','.join(cats) for cats in predicted_categories],
+                                           index=[i for _, i in fold_indices])
+    df['Cross_Validation_Fold'] = pd.Series([fold for fold, _ in fold_indices], index=[i for _, i in fold_indices])
 
     # Save the updated DataFrame to a new CSV file
     output_file = 'output/original_papers_with_cross_val_predictions.csv'
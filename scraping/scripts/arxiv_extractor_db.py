@@ -1,11 +1,23 @@
 import arxiv
-import csv
 from datetime import datetime
-import re
 import logging
 import os
 import sqlite3
 import json
+from collections import Counter
+
+import pipeline
+from bulk_ingest import configure_connection, paper_to_row
+from metrics import append_jsonl, build_record, write_prometheus
+from paper_search import init_fts
+from query_planner import plan_queries
+from rate_limiter import TokenBucket
+from relevance import get_matcher
+from response_cache import CachedSession, ResponseCache
+from run_lock import LockHeld, RunLock
+from schema import init_schema, normalise_rows
+from topics import TopicEngine, init_topics, load_topics
+from watermarks import get_watermarks, init_watermarks, update_watermarks, watermark_scope
 
 
 # Load configuration
@@ -26,33 +38,63 @@ LOG_DIR = os.path.join(BASE_DIR, config['log_dir'])
 OUTPUT_DIR = os.path.join(BASE_DIR, config['output_dir'])
 DB_FILE = os.path.join(BASE_DIR, config['db_file'])
 
+# In incremental mode queries are sorted by submission date and only paged until the last seen paper
+INCREMENTAL = config.get('incremental', False)
+
+# Collapse overlapping queries into a minimal set of API searches. Only lossless when no query is cut off by
+# max_results, which holds in incremental mode once every planned query has a watermark.
+PLAN_QUERIES = config.get('plan_queries', False)
+
+# Local cache of API responses, so re-runs after a crash or config tweak don't repeat API calls.
+# The mode can be overridden per run: default, cache-only, refresh or bypass.
+CACHE_FILE = os.path.join(BASE_DIR, config['cache_file']) if config.get('cache_file') else None
+CACHE_MODE = os.environ.get('ARXIV_CACHE_MODE', config.get('cache_mode', 'default'))
+CACHE_TTL = config.get('cache_ttl', 3600)
+
+# Per-run metrics (see metrics.py): one JSON line per run, plus an optional Prometheus textfile-collector file
+METRICS_FILE = os.path.join(BASE_DIR, config.get('metrics_file', '../logs/run_metrics.jsonl'))
+PROMETHEUS_FILE = os.path.join(BASE_DIR, config['prometheus_file']) if config.get('prometheus_file') else None
+
+# Held for the duration of every run, so a cron run never overlaps with another run or the daemon (scheduler.py)
+LOCK_FILE = DB_FILE + '.lock'
+
 # Create necessary directories
-os.makedirs(LOG_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+if CACHE_FILE:
+    os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+
 
-# Setup logging
-logging.basicConfig(
-    filename=os.path.join(LOG_DIR, f"arxiv_extractor_{datetime.now().strftime('%Y%m%d')}.log"),
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+def setup_logging():
+    """
+    Log to today's file in the log directory. Called by the scripts' main(), so that modules importing this one
+    (export_papers, paper_search, ...) don't create log files.
+    """
+    os.makedirs(LOG_DIR, exist_ok=True)
+    logging.basicConfig(
+        filename=os.path.join(LOG_DIR, f"arxiv_extractor_{datetime.now().strftime('%Y%m%d')}.log"),
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
 
 
 def is_relevant(paper, must_include, optional_keywords):
     """Check if the paper is relevant based on its title and abstract"""
-    text = (paper.title + " " + paper.summary).lower()
-    return any(keyword.lower() in text for keyword in must_include) and \
-        any(keyword.lower() in text for keyword in optional_keywords)
+    return get_matcher(must_include, optional_keywords).paper_is_relevant(paper)
 
 
 def init_db():
     """Initialize the SQLite database"""
     conn = sqlite3.connect(DB_FILE)
+    configure_connection(conn)
     c = conn.cursor()
     c.execute('''CREATE TABLE IF NOT EXISTS papers
                  (id TEXT PRIMARY KEY, title TEXT, authors TEXT, 
                   published_date TEXT, abstract TEXT, url TEXT, categories TEXT)''')
     conn.commit()
+    init_watermarks(conn)
+    init_fts(conn)
+    init_schema(conn)
+    init_topics(conn)
     return conn
 
 
@@ -67,87 +109,146 @@ def insert_paper(conn, paper):
     """Insert a new paper into the database"""
     c = conn.cursor()
     c.execute('''INSERT INTO papers (id, title, authors, published_date, abstract, url, categories)
-                 VALUES (?, ?, ?, ?, ?, ?, ?)''',
-              (paper.entry_id, paper.title, ', '.join([author.name for author in paper.authors]),
-               paper.published.strftime('%Y-%m-%d'), paper.summary, paper.entry_id, ', '.join(paper.categories)))
+                 VALUES (?, ?, ?, ?, ?, ?, ?)''', paper_to_row(paper))
+    normalise_rows(conn, [paper_to_row(paper)])
     conn.commit()
 
 
-# Define the main keywords we're interested in
-must_include = ["large language models", "LLMs", "GPT", "BERT", "transformers"]
-optional_keywords = ["automated planning", "symbolic planning", "neurosymbolic planning",
-                     "task planning", "AI planning", "PDDL", "constraint-based planning",
-                     "hierarchical task planning", "multi-agent planning", "robot planning"]
-
-# Define queries
-queries = [
-    'cat:cs.AI AND ("large language models" OR "LLMs" OR "GPT" OR "BERT" OR transformers)',
-    'cat:cs.AI AND ("automated planning" OR "symbolic planning" OR "neurosymbolic planning" OR "task planning" OR "AI planning")',
-    'cat:cs.AI AND ("neural-symbolic" OR "neurosymbolic") AND planning',
-    'cat:cs.AI AND ("large language models" OR "LLMs" OR "GPT" OR "BERT" OR transformers) AND planning',
-    'cat:cs.AI AND ("large language models" OR "LLMs" OR "GPT" OR "BERT" OR transformers) AND PDDL'
-]
+# Research topics (config.json `topics`), each with its own queries, keywords and output directory
+TOPICS = load_topics(config)
+
+# Keywords and queries of the first topic, for scripts that work with a single topic
+must_include = TOPICS[0].must_include
+optional_keywords = TOPICS[0].optional_keywords
+queries = TOPICS[0].queries
+
+
+def topic_output_dir(topic):
+    """Output directory of a topic, relative to the base directory like the other configured paths"""
+    return os.path.join(BASE_DIR, topic.output_dir) if topic.output_dir else OUTPUT_DIR
+
+
+def run_extraction(conn, cache=None, session=None, limiter=None, topics=None):
+    """
+    One extraction run over an open database connection. The union of all topics' queries is fetched once,
+    and every paper is tagged with each topic it is relevant to and written to that topic's CSV file.
+    The scheduler daemon calls this repeatedly with the same connection, cache and HTTP session; main() calls it once.
+    :param session: Shared CachedSession for all API clients (a new one for this run if omitted)
+    :param limiter: TokenBucket the session was built with (a new one if omitted)
+    :param topics: Topics to run (defaults to all configured topics)
+    :return: Counter with the fetched, duplicates, relevant, inserted, skipped and written counts,
+             plus relevant:<topic> and written:<topic> per topic
+    """
+    started = datetime.now()
+    engine = TopicEngine(topics or TOPICS)
+    own_session = session is None
+    if own_session:
+        limiter = limiter or TokenBucket()
+        session = CachedSession(cache, CACHE_MODE, limiter)
+    cache_hits, network_requests = session.cache_hits, session.network_requests
+
+    # Send the planned queries instead of the original ones, keeping track of which originals each one covers
+    api_queries = engine.queries()
+    if PLAN_QUERIES:
+        plans = plan_queries(api_queries)
+        api_queries = [plan.query for plan in plans]
+        for plan in plans:
+            logging.info(f"Planned query '{plan.query}' covers: {'; '.join(plan.sources)}")
+
+    # In incremental mode, queries are sorted by submission date and stop at their stored watermark.
+    # Marks are kept per set of topics, since a paper skipped for one topic may still be new to another.
+    fetch_options = {'sort_by': arxiv.SortCriterion.Relevance}
+    newest = {}
+    scope = watermark_scope(topic.name for topic in engine.topics)
+    if INCREMENTAL:
+        watermarks = get_watermarks(conn, api_queries, scope)
+        logging.info(f"Incremental mode: {len(watermarks)} of {len(api_queries)} queries have a stored watermark")
+        fetch_options = {'sort_by': arxiv.SortCriterion.SubmittedDate, 'watermarks': watermarks, 'newest': newest}
+
+    query_stats = {}
+    fetch_options['limiter'] = limiter
+    fetch_options['query_stats'] = query_stats
+    fetch_options['client_options'] = {'session': session}
+
+    # Stream papers through fetch -> dedupe -> topic filter -> DB upsert, then write the new ones to per-topic CSVs.
+    # Papers are fetched concurrently behind a shared rate limiter and stored as they arrive.
+    counts = Counter()
+    timings = Counter()
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    csv_filenames = {}
+    for topic in engine.topics:
+        os.makedirs(topic_output_dir(topic), exist_ok=True)
+        csv_filenames[topic.name] = os.path.join(topic_output_dir(topic),
+                                                 f"new_arxiv_papers_{topic.name}_{timestamp}.csv")
+    tags = {}
+    fetched = pipeline.fetch(api_queries, max_results=200, counts=counts, timings=timings, **fetch_options)
+    try:
+        papers = pipeline.dedupe(fetched, counts=counts)
+        papers = pipeline.topic_filter(papers, engine, tags, counts=counts, timings=timings)
+        # Store every paper before writing any CSV, so a failing CSV writer can't keep papers out of the database.
+        # Only the new papers are held until the CSVs are written.
+        new_papers = list(pipeline.db_upsert(papers, conn, tags=tags, counts=counts, timings=timings))
+    finally:
+        # Stop the fetch workers now, not when the generator is garbage collected
+        fetched.close()
+
+    # Only move the watermarks forward once the papers they cover are stored
+    if INCREMENTAL:
+        update_watermarks(conn, {query: [paper] for query, paper in newest.items()}, scope)
+
+    try:
+        written = pipeline.write_topic_csvs(new_papers, tags, csv_filenames, counts=counts, timings=timings)
+        for name, n in written.items():
+            if n:
+                logging.info(f"CSV file '{csv_filenames[name]}' has been created with {n} new relevant papers.")
+            else:
+                logging.info(f"No new papers found for topic '{name}' in this run.")
+    except Exception as e:
+        logging.error(f"Error writing to CSV file: {str(e)}")
+
+    logging.info(f"Fetched {counts['fetched']} papers ({counts['duplicates']} duplicates), "
+                 f"{counts['relevant']} relevant, inserted {counts['inserted']} new papers into the database, "
+                 f"skipped {counts['skipped']} existing papers")
+
+    record = build_record(started, datetime.now(), [topic.name for topic in engine.topics], counts, timings,
+                          query_stats, session.cache_hits - cache_hits, session.network_requests - network_requests)
+    try:
+        append_jsonl(METRICS_FILE, record)
+        if PROMETHEUS_FILE:
+            write_prometheus(PROMETHEUS_FILE, record)
+    except OSError as e:
+        logging.error(f"Error writing run metrics: {str(e)}")
+    logging.info(f"Run took {record['duration_seconds']:.1f}s: fetch {timings['fetch']:.1f}s, "
+                 f"filter {timings['filter']:.2f}s, db {timings['db']:.2f}s, {record['pages']} pages, "
+                 f"{record['cache_hits']} cache hits, {record['papers_per_second'] or 0:.1f} papers/s")
+    if own_session:
+        session.close()
+    return counts
 
 
 def main():
+    setup_logging()
     logging.info("Starting arXiv paper extraction")
 
-    client = arxiv.Client()
-    all_papers = []
-
-    # Fetch papers for each query
-    for query in queries:
-        logging.info(f"Executing query: {query}")
-        try:
-            search = arxiv.Search(
-                query=query,
-                max_results=200,
-                sort_by=arxiv.SortCriterion.Relevance
-            )
-            all_papers.extend(list(client.results(search)))
-        except Exception as e:
-            logging.error(f"Error executing query '{query}': {str(e)}")
-
-    # Initialize database connection
-    conn = init_db()
-
-    # Filter papers and check for duplicates
-    new_papers = []
-    for paper in all_papers:
-        if is_relevant(paper, must_include, optional_keywords) and not paper_exists(conn, paper.entry_id):
-            new_papers.append(paper)
-            insert_paper(conn, paper)
-
-    # Sort new papers by date (most recent first)
-    new_papers.sort(key=lambda x: x.published, reverse=True)
-
-    # Write new papers to CSV
-    if new_papers:
-        csv_filename = os.path.join(OUTPUT_DIR, f"new_arxiv_papers_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
-
-        try:
-            with open(csv_filename, mode='w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow(['Title', 'Authors', 'Published Date', 'Abstract', 'URL', 'Categories'])
-
-                for paper in new_papers:
-                    writer.writerow([
-                        paper.title,
-                        ', '.join([author.name for author in paper.authors]),
-                        paper.published.strftime('%Y-%m-%d'),
-                        re.sub(r'\s+', ' ', paper.summary).strip(),
-                        paper.entry_id,
-                        ', '.join(paper.categories)
-                    ])
-
-            logging.info(f"CSV file '{csv_filename}' has been created with {len(new_papers)} new relevant papers.")
-        except Exception as e:
-            logging.error(f"Error writing to CSV file: {str(e)}")
-    else:
-        logging.info("No new papers found in this run.")
-
-    # Close database connection
-    conn.close()
+    lock = RunLock(LOCK_FILE)
+    try:
+        lock.acquire()
+    except LockHeld as e:
+        logging.warning(f"Skipping run: {str(e)}")
+        return
+
+    try:
+        # Initialize database connection
+        conn = init_db()
+        cache = ResponseCache(CACHE_FILE, ttl=CACHE_TTL) if CACHE_FILE else None
+        run_extraction(conn, cache)
+
+        # Close database and cache connections
+        conn.close()
+        if cache is not None:
+            cache.close()
+    finally:
+        lock.release()
 
 
 if __name__ == "__main__":
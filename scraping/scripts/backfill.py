@@ -0,0 +1,297 @@
+"""
+Resumable backfill of a large date range, split into submittedDate shards.
+
+Every topic query is run once per shard as `(<query>) AND submittedDate:[<start> TO <end>]`, sorted by submission
+date (oldest first) so result offsets stay stable. Shards run in a bounded thread pool behind the shared rate
+limiter. Worker threads only fetch; the main thread stores each page of relevant papers and the shard's next
+offset in the same transaction, so after a crash or Ctrl-C a restart of the same command resumes every shard at
+the first page that was not stored yet.
+
+Transient errors (HTTP errors, empty pages, connection errors) are retried with exponential backoff from the last
+fetched page. Shards that still fail are marked `failed` and retried on the next run.
+
+Usage:
+    python backfill.py --start 2020-01-01 --end 2024-12-31 [--shard-days 7] [--workers 3] [--topic NAME]
+    python backfill.py --start 2020-01-01 --end 2024-12-31 --status
+"""
+import argparse
+import logging
+import queue
+import random
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import arxiv
+import requests
+
+from arxiv_extractor_db import DB_FILE, TOPICS, init_db, setup_logging
+from bulk_ingest import paper_to_row, upsert_rows
+from concurrent_fetch import RateLimitedClient
+from rate_limiter import TokenBucket
+from run_lock import LockHeld, RunLock
+from topics import TopicEngine, tag_papers
+
+# arXiv does not page beyond this offset, so shards should be small enough to stay below it
+MAX_OFFSET = 10000
+
+TRANSIENT_ERRORS = (arxiv.HTTPError, arxiv.UnexpectedEmptyPageError, requests.exceptions.RequestException)
+
+
+def init_backfill(conn):
+    """Create the table checkpointing every shard of every backfill job"""
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS backfill_shards
+                 (job TEXT, query TEXT, shard_start TEXT, shard_end TEXT, status TEXT, next_offset INTEGER,
+                  fetched INTEGER, relevant INTEGER, attempts INTEGER, last_error TEXT,
+                  updated_at TEXT, PRIMARY KEY (job, query, shard_start))''')
+    conn.commit()
+
+
+def shard_ranges(start, end, days=7):
+    """
+    Split [start, end] (YYYY-MM-DD, both inclusive) into consecutive ranges of `days` days.
+    :return: List of (start, end) in arXiv's submittedDate format YYYYMMDDHHMM
+    """
+    first = datetime.strptime(start, '%Y-%m-%d')
+    last = datetime.strptime(end, '%Y-%m-%d')
+    ranges = []
+    while first <= last:
+        shard_end = min(first + timedelta(days=days - 1), last)
+        ranges.append((first.strftime('%Y%m%d0000'), shard_end.strftime('%Y%m%d2359')))
+        first = shard_end + timedelta(days=1)
+    return ranges
+
+
+def shard_query(query, shard_start, shard_end):
+    return f"({query}) AND submittedDate:[{shard_start} TO {shard_end}]"
+
+
+def plan_shards(conn, job, queries, ranges):
+    """Register the shards of a job. Shards that already exist keep their checkpoint."""
+    now = datetime.now().isoformat()
+    with conn:
+        conn.executemany('''INSERT OR IGNORE INTO backfill_shards
+                            (job, query, shard_start, shard_end, status, next_offset, fetched, relevant, attempts,
+                             updated_at)
+                            VALUES (?, ?, ?, ?, 'pending', 0, 0, 0, 0, ?)''',
+                         [(job, query, shard_start, shard_end, now) for query in queries
+                          for shard_start, shard_end in ranges])
+
+
+def pending_shards(conn, job, include_failed=True):
+    """:return: List of (query, shard_start, shard_end, next_offset) of all shards not done yet, oldest first"""
+    statuses = ('pending', 'running', 'failed') if include_failed else ('pending', 'running')
+    return conn.execute(f'''SELECT query, shard_start, shard_end, next_offset FROM backfill_shards
+                            WHERE job = ? AND status IN ({', '.join('?' * len(statuses))})
+                            ORDER BY shard_start, query''', (job, *statuses)).fetchall()
+
+
+def fetch_pages(client, search, offset):
+    """
+    Page through a search from `offset` with the public client.results API.
+    The offsets count the results yielded. The client silently skips partial entries, so an offset can lag behind
+    the feed; resuming from it only fetches a few papers again, and storing them again is a no-op.
+    :return: Generator of (list of arxiv.Result, offset after the page), one per `client.page_size` results
+    """
+    page = []
+    for paper in client.results(search, offset=offset):
+        page.append(paper)
+        if len(page) == client.page_size:
+            offset += len(page)
+            yield page, offset
+            page = []
+    if page:
+        yield page, offset + len(page)
+
+
+def _put(pages, item, stop):
+    """Put an item on the queue unless the main thread has stopped reading"""
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def fetch_shard(client, shard, pages, stop, max_attempts=6, base_delay=5.0):
+    """
+    Fetch the remaining pages of one shard and put ('page', shard, results, next_offset) on the `pages` queue for
+    each of them, followed by ('done', shard) or ('failed', shard, error).
+    Transient errors are retried from the last fetched page after base_delay * 2^attempt seconds (plus jitter).
+    """
+    query, shard_start, shard_end, offset = shard
+    search = arxiv.Search(query=shard_query(query, shard_start, shard_end), max_results=MAX_OFFSET,
+                          sort_by=arxiv.SortCriterion.SubmittedDate, sort_order=arxiv.SortOrder.Ascending)
+    attempt = 0
+    while not stop.is_set():
+        try:
+            for results, offset in fetch_pages(client, search, offset):
+                attempt = 0
+                if not _put(pages, ('page', shard, results, offset), stop):
+                    return
+        except TRANSIENT_ERRORS as e:
+            attempt += 1
+            if attempt >= max_attempts:
+                _put(pages, ('failed', shard, str(e)), stop)
+                return
+            delay = base_delay * 2 ** (attempt - 1) + random.uniform(0, base_delay)
+            logging.warning(f"Backfill: shard {shard_start}-{shard_end} of '{query}' failed at offset {offset} "
+                            f"({str(e)}), retrying in {delay:.0f}s")
+            if stop.wait(delay):
+                return
+            continue
+        except Exception as e:
+            _put(pages, ('failed', shard, str(e)), stop)
+            return
+
+        if offset >= MAX_OFFSET:
+            logging.warning(f"Backfill: shard {shard_start}-{shard_end} of '{query}' has more than {MAX_OFFSET} "
+                            f"results, only the first {MAX_OFFSET} can be fetched; use smaller shards")
+        _put(pages, ('done', shard), stop)
+        return
+
+
+def run_backfill(job, start, end, shard_days=7, workers=3, topics=None, retry_failed=True):
+    """
+    Run (or resume) a backfill job.
+    :param job: Name of the job; its checkpoints are stored under this name
+    :param start: First submission date (YYYY-MM-DD)
+    :param end: Last submission date (YYYY-MM-DD)
+    :param shard_days: Days per shard
+    :param workers: Shards fetched in parallel
+    :param topics: Topics whose queries are backfilled and whose keywords filter the results (default: all)
+    :param retry_failed: Also run shards that failed in an earlier run
+    :return: Counter with the shards done and failed, and the papers fetched, relevant and inserted
+    """
+    conn = init_db()
+    init_backfill(conn)
+    engine = TopicEngine(topics or TOPICS)
+    plan_shards(conn, job, engine.queries(), shard_ranges(start, end, shard_days))
+    shards = pending_shards(conn, job, include_failed=retry_failed)
+    logging.info(f"Backfill '{job}': {len(shards)} shards to run with {workers} workers")
+
+    limiter = TokenBucket()
+    local = threading.local()
+    pages = queue.Queue(maxsize=workers * 2)
+    stop = threading.Event()
+    stats = Counter()
+
+    def run(shard):
+        if not hasattr(local, 'client'):
+            local.client = RateLimitedClient(limiter)
+        fetch_shard(local.client, shard, pages, stop)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(run, shard) for shard in shards]
+        remaining = len(shards)
+        while remaining:
+            try:
+                message = pages.get(timeout=1)
+            except queue.Empty:
+                # A worker that died without reporting would otherwise leave us waiting forever
+                if all(future.done() for future in futures) and pages.empty():
+                    break
+                continue
+            kind, shard = message[0], message[1]
+            if kind == 'page':
+                results, next_offset = message[2:]
+                tags = {}
+                for paper in results:
+                    names = engine.match_paper(paper)
+                    if names:
+                        tags[paper.entry_id] = names
+                relevant = [paper for paper in results if paper.entry_id in tags]
+                # The papers and the shard's next offset are committed together, so a restart resumes exactly here
+                with conn:
+                    inserted, skipped = upsert_rows(conn, [paper_to_row(paper) for paper in relevant])
+                    tag_papers(conn, tags, datetime.now().isoformat())
+                    conn.execute('''UPDATE backfill_shards SET status = 'running', next_offset = ?,
+                                    fetched = fetched + ?, relevant = relevant + ?,
+                                    updated_at = ? WHERE job = ? AND query = ? AND shard_start = ?''',
+                                 (next_offset, len(results), len(relevant), datetime.now().isoformat(),
+                                  job, shard[0], shard[1]))
+                stats['fetched'] += len(results)
+                stats['relevant'] += len(relevant)
+                stats['inserted'] += len(inserted)
+            elif kind == 'done':
+                with conn:
+                    conn.execute('''UPDATE backfill_shards SET status = 'done', last_error = NULL, updated_at = ?
+                                    WHERE job = ? AND query = ? AND shard_start = ?''',
+                                 (datetime.now().isoformat(), job, shard[0], shard[1]))
+                stats['done'] += 1
+                remaining -= 1
+                logging.info(f"Backfill '{job}': shard {shard[1]}-{shard[2]} of '{shard[0]}' done, "
+                             f"{remaining} remaining")
+            else:
+                with conn:
+                    conn.execute('''UPDATE backfill_shards SET status = 'failed', attempts = attempts + 1,
+                                    last_error = ?, updated_at = ? WHERE job = ? AND query = ? AND shard_start = ?''',
+                                 (message[2], datetime.now().isoformat(), job, shard[0], shard[1]))
+                stats['failed'] += 1
+                remaining -= 1
+                logging.error(f"Backfill '{job}': shard {shard[1]}-{shard[2]} of '{shard[0]}' failed: {message[2]}")
+    finally:
+        # On Ctrl-C, stop the workers; pages already stored stay checkpointed
+        stop.set()
+        executor.shutdown(wait=True)
+        conn.close()
+
+    logging.info(f"Backfill '{job}': {stats['done']} shards done, {stats['failed']} failed, "
+                 f"{stats['fetched']} papers fetched, {stats['relevant']} relevant, {stats['inserted']} inserted")
+    return stats
+
+
+def job_status(job):
+    """:return: List of (status, shards, fetched, relevant) of a job"""
+    conn = init_db()
+    init_backfill(conn)
+    rows = conn.execute('''SELECT status, COUNT(*), SUM(fetched), SUM(relevant) FROM backfill_shards
+                           WHERE job = ? GROUP BY status ORDER BY status''', (job,)).fetchall()
+    conn.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumable backfill of a date range, split into shards")
+    parser.add_argument('--start', required=True, help="First submission date (YYYY-MM-DD)")
+    parser.add_argument('--end', required=True, help="Last submission date (YYYY-MM-DD)")
+    parser.add_argument('--shard-days', type=int, default=7, help="Days per shard (default: 7)")
+    parser.add_argument('--workers', type=int, default=3, help="Shards fetched in parallel (default: 3)")
+    parser.add_argument('--topic', action='append', dest='topics', choices=[topic.name for topic in TOPICS],
+                        help="Only backfill this topic (repeatable, default: all topics)")
+    parser.add_argument('--job', help="Checkpoint name (default: derived from the dates and shard size)")
+    parser.add_argument('--skip-failed', action='store_true', help="Don't retry shards that failed before")
+    parser.add_argument('--status', action='store_true', help="Only show the progress of the job")
+    args = parser.parse_args()
+    setup_logging()
+
+    job = args.job or f"{args.start}_{args.end}_{args.shard_days}d"
+    if args.status:
+        for status, shards, fetched, relevant in job_status(job):
+            print(f"{status:8} {shards:6} shards  {fetched or 0:8} fetched  {relevant or 0:7} relevant")
+        return
+
+    # Only one backfill at a time; the regular extraction runs are not blocked
+    lock = RunLock(DB_FILE + '.backfill.lock')
+    try:
+        lock.acquire()
+    except LockHeld:
+        print("Another backfill is already running")
+        return
+    try:
+        topics = [topic for topic in TOPICS if topic.name in args.topics] if args.topics else None
+        stats = run_backfill(job, args.start, args.end, args.shard_days, args.workers, topics,
+                             retry_failed=not args.skip_failed)
+    finally:
+        lock.release()
+    print(f"Backfill '{job}': {stats['done']} shards done, {stats['failed']} failed, {stats['fetched']} fetched, "
+          f"{stats['relevant']} relevant, {stats['inserted']} new papers")
+
+
+if __name__ == "__main__":
+    main()
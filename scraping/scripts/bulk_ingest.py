@@ -0,0 +1,103 @@
+import logging
+
+from schema import ID_CHUNK_SIZE, normalise_rows, parse_entry_id
+
+
+def configure_connection(conn):
+    """
+    Tune a connection for bulk writes: WAL journal (readers don't block the writer and commits append
+    instead of rewriting pages), NORMAL synchronous (safe with WAL), a 64 MB page cache and in-memory temp tables.
+    """
+    c = conn.cursor()
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute("PRAGMA synchronous=NORMAL")
+    c.execute("PRAGMA cache_size=-64000")
+    c.execute("PRAGMA temp_store=MEMORY")
+
+
+def paper_to_row(paper):
+    """Convert an arxiv.Result into a row of the papers table"""
+    return (paper.entry_id, paper.title, ', '.join([author.name for author in paper.authors]),
+            paper.published.strftime('%Y-%m-%d'), paper.summary, paper.entry_id, ', '.join(paper.categories))
+
+
+def existing_ids(conn, ids):
+    """Return the subset of ids already stored in the papers table"""
+    ids = list(ids)
+    found = set()
+    c = conn.cursor()
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        chunk = ids[start:start + ID_CHUNK_SIZE]
+        c.execute(f"SELECT id FROM papers WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+        found.update(row[0] for row in c.fetchall())
+    return found
+
+
+def existing_articles(conn, arxiv_ids):
+    """Return the subset of canonical arXiv ids (without version suffix) already stored in the articles table"""
+    arxiv_ids = list(arxiv_ids)
+    found = set()
+    c = conn.cursor()
+    for start in range(0, len(arxiv_ids), ID_CHUNK_SIZE):
+        chunk = arxiv_ids[start:start + ID_CHUNK_SIZE]
+        c.execute(f"SELECT arxiv_id FROM articles WHERE arxiv_id IN ({', '.join('?' * len(chunk))})", chunk)
+        found.update(row[0] for row in c.fetchall())
+    return found
+
+
+def _article_key(entry_id):
+    """Canonical arXiv id of an entry, or the entry id itself if it can't be parsed"""
+    try:
+        return parse_entry_id(entry_id)[0]
+    except ValueError:
+        return entry_id
+
+
+def upsert_rows(conn, rows, update_existing=False):
+    """
+    Write rows of the papers table with one executemany upsert, mirroring them into the normalised tables
+    of schema.py. Does not commit, so callers control the transaction (e.g. `with conn:` around a whole run).
+    :param conn: SQLite connection
+    :param rows: Iterable of (id, title, authors, published_date, abstract, url, categories) tuples
+    :param update_existing: Overwrite the stored fields of papers that already exist instead of skipping them
+    :return: Tuple of (list of ids of rows that are new papers, number of other rows). A new version of a paper
+             that is already stored gets its own row in papers, but is not a new paper.
+    """
+    rows = list(rows)
+    stored = existing_ids(conn, {row[0] for row in rows})
+    keys = {row[0]: _article_key(row[0]) for row in rows}
+    # Papers are new if no version of them is stored yet; ids that don't parse fall back to the exact id
+    seen = existing_articles(conn, set(keys.values())) | {keys[entry_id] for entry_id in stored}
+    inserted = []
+    for row in rows:
+        if keys[row[0]] not in seen:
+            seen.add(keys[row[0]])
+            inserted.append(row[0])
+
+    if update_existing:
+        conflict = '''DO UPDATE SET title = excluded.title, authors = excluded.authors,
+                      published_date = excluded.published_date, abstract = excluded.abstract,
+                      url = excluded.url, categories = excluded.categories'''
+    else:
+        conflict = 'DO NOTHING'
+    conn.executemany(f'''INSERT INTO papers (id, title, authors, published_date, abstract, url, categories)
+                         VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(id) {conflict}''', rows)
+
+    # Keep the normalised tables (see schema.py) in sync with every row that was written
+    normalise_rows(conn, rows if update_existing else [row for row in rows if row[0] not in stored])
+
+    skipped = len(rows) - len(inserted)
+    logging.info(f"Bulk ingest: {len(inserted)} new papers, {skipped} rows already stored or new versions")
+    return inserted, skipped
+
+
+def ingest_papers(conn, papers, update_existing=False):
+    """
+    Insert arxiv.Result papers in a single transaction.
+    :return: Tuple of (list of newly inserted papers, number of skipped papers)
+    """
+    papers = list(papers)
+    with conn:
+        inserted, skipped = upsert_rows(conn, (paper_to_row(paper) for paper in papers), update_existing)
+    inserted = set(inserted)
+    return [paper for paper in papers if paper.entry_id in inserted], skipped
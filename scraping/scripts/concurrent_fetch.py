@@ -0,0 +1,170 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import arxiv
+
+from rate_limiter import TokenBucket
+from response_cache import DEFAULT, CachedSession
+from watermarks import until_watermark
+
+
+class RateLimitedClient(arxiv.Client):
+    """
+    arxiv.Client that takes a token from a shared limiter before every page request that goes to the network
+    (retries included), optionally serving pages from a ResponseCache.
+    Retries skip the cache, so a bad page that was cached is not served again.
+    The client's own per-instance delay is disabled, since the limiter already spaces requests across all clients.
+    A long-running process can pass one `session` (a CachedSession built with the same limiter) to all clients,
+    so its connection pool stays warm between runs.
+    """
+
+    def __init__(self, limiter, cache=None, cache_mode=DEFAULT, session=None, **kwargs):
+        kwargs.setdefault('delay_seconds', 0)
+        super().__init__(**kwargs)
+        self.limiter = limiter
+        self._session = session or CachedSession(cache, cache_mode, limiter)
+        # Result pages requested and retried by this client, for run metrics
+        self.pages = 0
+        self.retries = 0
+
+    def _parse_feed(self, url, first_page=True, _try_index=0):
+        if _try_index == 0:
+            self.pages += 1
+            return super()._parse_feed(url, first_page=first_page, _try_index=_try_index)
+        self.retries += 1
+        with self._session.refreshing():
+            return super()._parse_feed(url, first_page=first_page, _try_index=_try_index)
+
+
+def _query_results(client, query, max_results, sort_by, watermark):
+    """Lazily iterate over the results of one query, stopping at its watermark if it has one"""
+    search = arxiv.Search(query=query, max_results=None if watermark else max_results, sort_by=sort_by)
+    results = client.results(search)
+    if watermark:
+        results = until_watermark(results, watermark)
+    return results
+
+
+def fetch_queries(queries, max_results=200, sort_by=arxiv.SortCriterion.Relevance, max_workers=None, limiter=None,
+                  watermarks=None, client_options=None):
+    """
+    Run all queries in parallel behind one shared rate limiter.
+    :param queries: List of arXiv query strings
+    :param max_results: Maximum number of results per query
+    :param sort_by: arxiv.SortCriterion used for every query
+    :param max_workers: Number of worker threads (defaults to one per query)
+    :param limiter: Shared TokenBucket; a new one following arXiv's 3 second rule is created if omitted
+    :param watermarks: Optional dictionary mapping query to its (published, entry_id) high-water mark.
+                       Queries with a mark are paged only until they reach it, without the `max_results` cap,
+                       so `sort_by` should be SubmittedDate.
+    :param client_options: Extra keyword arguments for every RateLimitedClient, e.g. `cache` and `cache_mode`
+    :return: Dictionary mapping each query to its list of results, in the order of `queries`.
+             Queries that failed are logged and map to an empty list.
+    """
+    limiter = limiter or TokenBucket()
+    local = threading.local()
+
+    def run(query):
+        # arxiv.Client keeps per-instance request state, so each worker thread gets its own
+        if not hasattr(local, 'client'):
+            local.client = RateLimitedClient(limiter, **(client_options or {}))
+        logging.info(f"Executing query: {query}")
+        try:
+            return list(_query_results(local.client, query, max_results, sort_by, (watermarks or {}).get(query)))
+        except Exception as e:
+            logging.error(f"Error executing query '{query}': {str(e)}")
+            return []
+
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(queries), 1)) as executor:
+        results = list(executor.map(run, queries))
+    return dict(zip(queries, results))
+
+
+def stream_queries(queries, max_results=200, sort_by=arxiv.SortCriterion.Relevance, max_workers=None, limiter=None,
+                   watermarks=None, newest=None, buffer_size=1000, client_options=None, query_stats=None):
+    """
+    Like fetch_queries, but yield results as soon as any worker receives them instead of collecting them.
+    Workers block once `buffer_size` results are waiting, so memory stays bounded however many results come back.
+    :param newest: Optional dictionary that is filled with query -> first (newest, when sorted by SubmittedDate)
+                   result for every query that finished without error, e.g. to update watermarks afterwards
+    :param query_stats: Optional dictionary that is filled with query -> {'seconds', 'pages', 'retries', 'results',
+                        'error'} once each query finishes
+    :return: Generator of arxiv.Result, in arrival order
+    """
+    limiter = limiter or TokenBucket()
+    local = threading.local()
+    buffer = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # Give up when the consumer has stopped reading, so workers never block forever on a full buffer
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run(query):
+        if not hasattr(local, 'client'):
+            local.client = RateLimitedClient(limiter, **(client_options or {}))
+        logging.info(f"Executing query: {query}")
+        start, pages, retries = time.time(), local.client.pages, local.client.retries
+        results = 0
+        error = None
+        try:
+            first = None
+            for paper in _query_results(local.client, query, max_results, sort_by, (watermarks or {}).get(query)):
+                if first is None:
+                    first = paper
+                results += 1
+                if not put(paper):
+                    return
+            if newest is not None and first is not None:
+                newest[query] = first
+        except Exception as e:
+            error = str(e)
+            logging.error(f"Error executing query '{query}': {str(e)}")
+        finally:
+            if query_stats is not None:
+                query_stats[query] = {'seconds': round(time.time() - start, 3), 'pages': local.client.pages - pages,
+                                      'retries': local.client.retries - retries, 'results': results, 'error': error}
+            put(done)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers or max(len(queries), 1))
+    for query in queries:
+        executor.submit(run, query)
+    try:
+        remaining = len(queries)
+        while remaining:
+            item = buffer.get()
+            if item is done:
+                remaining -= 1
+            else:
+                yield item
+    finally:
+        stop.set()
+        executor.shutdown(wait=True)
+
+
+def deduplicate(papers):
+    """Remove duplicate papers based on their IDs, keeping the first occurrence"""
+    seen = set()
+    return [paper for paper in papers if not (paper.entry_id in seen or seen.add(paper.entry_id))]
+
+
+def fetch_all(queries, max_results=200, sort_by=arxiv.SortCriterion.Relevance, max_workers=None, limiter=None,
+              watermarks=None, client_options=None):
+    """
+    Fetch all queries concurrently and return the deduplicated results.
+    Results are merged in query order, so the output matches running the queries one after another.
+    """
+    per_query = fetch_queries(queries, max_results=max_results, sort_by=sort_by,
+                              max_workers=max_workers, limiter=limiter, watermarks=watermarks,
+                              client_options=client_options)
+    return deduplicate([paper for query in queries for paper in per_query[query]])
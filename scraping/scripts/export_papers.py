@@ -1,37 +1,198 @@
+import argparse
 import csv
+import json
 import os
-import sqlite3
 from datetime import datetime
 
+from arxiv_extractor_db import OUTPUT_DIR, init_db
 
-def export_all_papers():
-    """Export all papers from the database to a CSV file"""
-    conn = sqlite3.connect("../db/arxiv_papers.db")
-    c = conn.cursor()
+COLUMNS = ['ID', 'Title', 'Authors', 'Published Date', 'Abstract', 'URL', 'Categories']
+
+
+class CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, mode='w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class JsonlWriter:
+    def __init__(self, path):
+        self.file = open(path, mode='w', encoding='utf-8')
 
-    # Get all papers from the database
-    c.execute("SELECT * FROM papers ORDER BY published_date DESC")
-    papers = c.fetchall()
+    def write(self, rows):
+        self.file.writelines(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + '\n' for row in rows)
 
-    if papers:
-        csv_filename = os.path.join("../out", f"all_arxiv_papers_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    def close(self):
+        self.file.close()
 
+
+class ParquetWriter:
+    """Columnar, zstd-compressed output written one row group per fetched batch (needs pyarrow)"""
+
+    def __init__(self, path):
         try:
-            with open(csv_filename, mode='w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow(['ID', 'Title', 'Authors', 'Published Date', 'Abstract', 'URL', 'Categories'])
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet export needs pyarrow: pip install pyarrow")
+        self.pa = pa
+        self.schema = pa.schema([(column, pa.string()) for column in COLUMNS])
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self.writer.write_table(self.pa.Table.from_arrays(
+            [self.pa.array(column, type=self.pa.string()) for column in columns], schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {'csv': CsvWriter, 'jsonl': JsonlWriter, 'parquet': ParquetWriter}
+
+
+def init_export_watermarks(conn):
+    """Create the table remembering up to which paper_changes sequence number each export has run"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS export_watermarks
+                    (name TEXT PRIMARY KEY, last_seq INTEGER, exported_at TEXT)''')
+    conn.commit()
 
-                for paper in papers:
-                    writer.writerow(paper)
 
-            print(f"Exported {len(papers)} papers to {csv_filename}")
-        except Exception as e:
-            print(f"Error exporting papers: {str(e)}")
+def build_query(since=None, until=None, categories=None, after_seq=None, up_to_seq=None):
+    """
+    Build the export SELECT with every predicate pushed down into SQL, so only matching rows are read.
+    Categories are resolved through the normalised tables of schema.py, dates through the published_date index.
+    """
+    sql = "SELECT p.id, p.title, p.authors, p.published_date, p.abstract, p.url, p.categories FROM papers p"
+    where, params = [], []
+    if after_seq is not None:
+        sql += " JOIN paper_changes pc ON pc.paper_id = p.id"
+        where.append("pc.seq > ? AND pc.seq <= ?")
+        params += [after_seq, up_to_seq]
+    if since:
+        where.append("p.published_date >= ?")
+        params.append(since)
+    if until:
+        where.append("p.published_date <= ?")
+        params.append(until)
+    if categories:
+        where.append(f'''p.id IN (SELECT av.entry_id FROM article_versions av
+                         JOIN article_categories ac ON ac.arxiv_id = av.arxiv_id
+                         JOIN categories c ON c.category_id = ac.category_id
+                         WHERE c.name IN ({', '.join('?' * len(categories))}))''')
+        params += list(categories)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + " ORDER BY p.published_date DESC", params
+
+
+def export_papers(fmt='csv', output=None, since=None, until=None, categories=None, changed_since_last=None,
+                  batch_size=5000):
+    """
+    Stream papers from the database into a CSV, JSON-lines or Parquet file, reading `batch_size` rows at a time.
+    :param fmt: 'csv', 'jsonl' or 'parquet'
+    :param output: Output file (defaults to a timestamped file in the configured output directory)
+    :param since: Only papers published on or after this YYYY-MM-DD date
+    :param until: Only papers published on or before this YYYY-MM-DD date
+    :param categories: Only papers in any of these arXiv categories
+    :param changed_since_last: Name of an export watermark. Only papers inserted or updated since the last
+                               export with this name are written, and the watermark moves forward afterwards.
+    :return: Number of exported papers
+    """
+    conn = init_db()
+    init_export_watermarks(conn)
+
+    after_seq = up_to_seq = None
+    if changed_since_last:
+        row = conn.execute("SELECT last_seq FROM export_watermarks WHERE name = ?", (changed_since_last,)).fetchone()
+        after_seq = row[0] if row else 0
+        # Fix the upper bound before reading, so papers written during the export are picked up next time
+        up_to_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM paper_changes").fetchone()[0]
+
+    sql, params = build_query(since, until, categories, after_seq, up_to_seq)
+    c = conn.cursor()
+    c.execute(sql, params)
+
+    if output is None:
+        prefix = 'changed' if changed_since_last else 'all'
+        output = os.path.join(OUTPUT_DIR, f"{prefix}_arxiv_papers_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                                          f".{fmt}")
+
+    # Written under a temporary name, so a failed export never leaves a partial file under the output name
+    tmp_output = output + '.tmp'
+    writer = None
+    exported = 0
+    try:
+        while True:
+            rows = c.fetchmany(batch_size)
+            if not rows:
+                break
+            if writer is None:
+                writer = WRITERS[fmt](tmp_output)
+            writer.write(rows)
+            exported += len(rows)
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.replace(tmp_output, output)
+    except Exception as e:
+        # The watermark is left where it was, so the next incremental export retries these papers
+        print(f"Error exporting papers: {str(e)}")
+        conn.close()
+        return 0
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_output):
+            os.remove(tmp_output)
+
+    if changed_since_last:
+        conn.execute('''INSERT INTO export_watermarks (name, last_seq, exported_at) VALUES (?, ?, ?)
+                        ON CONFLICT(name) DO UPDATE SET last_seq = excluded.last_seq,
+                        exported_at = excluded.exported_at''',
+                     (changed_since_last, up_to_seq, datetime.now().isoformat()))
+        conn.commit()
+    conn.close()
+
+    if exported:
+        print(f"Exported {exported} papers to {output}")
+    elif changed_since_last:
+        print(f"No papers changed since the last export '{changed_since_last}'.")
+    elif since or until or categories:
+        print("No papers match the given filters.")
     else:
         print("No papers found in the database.")
+    return exported
 
-    conn.close()
+
+def export_all_papers():
+    """Export all papers from the database to a CSV file"""
+    return export_papers('csv')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export papers from the database")
+    parser.add_argument('--format', choices=sorted(WRITERS), default='csv', help="Output format (default: csv)")
+    parser.add_argument('--output', help="Output file (default: timestamped file in the output directory)")
+    parser.add_argument('--since', help="Only papers published on or after this date (YYYY-MM-DD)")
+    parser.add_argument('--until', help="Only papers published on or before this date (YYYY-MM-DD)")
+    parser.add_argument('--category', action='append', dest='categories',
+                        help="Only papers in this arXiv category (repeatable)")
+    parser.add_argument('--changed-since-last', metavar='NAME',
+                        help="Only papers inserted or updated since the last export with this watermark name")
+    parser.add_argument('--batch-size', type=int, default=5000, help="Rows read from the database at a time")
+    args = parser.parse_args()
+
+    export_papers(args.format, args.output, args.since, args.until, args.categories, args.changed_since_last,
+                  args.batch_size)
 
 
 if __name__ == "__main__":
-    export_all_papers()
+    main()
@@ -0,0 +1,162 @@
+"""
+Bulk offline ingest from a local arXiv metadata snapshot (the JSON-lines file of the public Kaggle/S3 dump),
+without touching the search API.
+
+The file is streamed in chunks of lines. A pool of worker processes parses the chunks and matches them against the
+configured topics (see topics.py), and the main process bulk-upserts the rows relevant to any topic into the papers
+table and tags them in paper_topics.
+Only a bounded number of chunks is in flight at any time, so memory stays constant for multi-GB files.
+
+Usage: python ingest_snapshot.py /path/to/arxiv-metadata-oai-snapshot.json[.gz] [--workers N] [--chunk-lines N]
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import time
+from collections import deque
+from datetime import datetime
+from multiprocessing import Pool
+
+from arxiv_extractor_db import TOPICS, init_db, setup_logging
+from bulk_ingest import upsert_rows
+from topics import TopicEngine, tag_papers
+
+_engine = None
+
+
+def _init_worker(topics):
+    global _engine
+    _engine = TopicEngine(topics)
+
+
+def record_to_row(record):
+    """
+    Convert a snapshot record into a row of the papers table, in the same format the scraper stores:
+    the versioned abs URL of the latest version as id, first-version date as published date.
+    """
+    versions = record.get('versions') or [{'version': 'v1'}]
+    entry_id = f"http://arxiv.org/abs/{record['id']}{versions[-1]['version']}"
+    if versions[0].get('created'):
+        published = datetime.strptime(versions[0]['created'], '%a, %d %b %Y %H:%M:%S %Z').strftime('%Y-%m-%d')
+    else:
+        published = record.get('update_date')
+    if record.get('authors_parsed'):
+        authors = ', '.join(' '.join(part for part in (first, last, *rest) if part)
+                            for last, first, *rest in record['authors_parsed'])
+    else:
+        authors = re.sub(r'\s+', ' ', record.get('authors') or '').strip()
+    return (entry_id, re.sub(r'\s+', ' ', record['title']).strip(), authors, published,
+            (record.get('abstract') or '').strip(), entry_id, ', '.join((record.get('categories') or '').split()))
+
+
+def _process_chunk(lines):
+    """
+    Parse and filter one chunk of lines in a worker.
+    Returns (relevant rows, dictionary of row id -> topic names, number of malformed lines).
+    """
+    rows = []
+    tags = {}
+    malformed = 0
+    for line in lines:
+        try:
+            record = json.loads(line)
+            # Snapshot titles and abstracts are hard-wrapped, so collapse whitespace before matching phrases
+            names = _engine.match(' '.join((record['title'] + " " + (record.get('abstract') or '')).split()))
+            if names:
+                row = record_to_row(record)
+                rows.append(row)
+                tags[row[0]] = names
+        except (ValueError, KeyError, TypeError, IndexError):
+            malformed += 1
+    return rows, tags, malformed
+
+
+def _read_chunks(path, chunk_lines):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as file:
+        chunk = []
+        for line in file:
+            if line.strip():
+                chunk.append(line)
+            if len(chunk) >= chunk_lines:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def ingest_snapshot(path, workers=None, chunk_lines=5000, commit_rows=50000):
+    """
+    Stream a snapshot file into the papers table.
+    :param path: Snapshot file (JSON lines, optionally gzipped)
+    :param workers: Number of parse/filter processes (defaults to all cores)
+    :param chunk_lines: Lines handed to a worker at once
+    :param commit_rows: Relevant rows collected before they are upserted in one transaction
+    :return: Dictionary with the number of records read, malformed, relevant, inserted and skipped
+    """
+    workers = workers or os.cpu_count() or 1
+    stats = {'records': 0, 'malformed': 0, 'relevant': 0, 'inserted': 0, 'skipped': 0}
+    conn = init_db()
+    pending_rows = []
+    pending_tags = {}
+    start = time.time()
+
+    def flush():
+        with conn:
+            inserted, skipped = upsert_rows(conn, pending_rows)
+            tag_papers(conn, pending_tags, datetime.now().isoformat())
+        stats['inserted'] += len(inserted)
+        stats['skipped'] += skipped
+        pending_rows.clear()
+        pending_tags.clear()
+
+    def collect(result, lines):
+        rows, tags, malformed = result
+        stats['records'] += lines
+        stats['malformed'] += malformed
+        stats['relevant'] += len(rows)
+        pending_rows.extend(rows)
+        pending_tags.update(tags)
+        if len(pending_rows) >= commit_rows:
+            flush()
+
+    with Pool(workers, initializer=_init_worker, initargs=(TOPICS,)) as pool:
+        # Keep only a few chunks per worker in flight so the reader never runs ahead of the workers
+        in_flight = deque()
+        for chunk in _read_chunks(path, chunk_lines):
+            in_flight.append((pool.apply_async(_process_chunk, (chunk,)), len(chunk)))
+            if len(in_flight) >= workers * 2:
+                job, lines = in_flight.popleft()
+                collect(job.get(), lines)
+        while in_flight:
+            job, lines = in_flight.popleft()
+            collect(job.get(), lines)
+    if pending_rows:
+        flush()
+    conn.close()
+
+    elapsed = time.time() - start
+    logging.info(f"Snapshot ingest of {path}: {stats['records']} records ({stats['malformed']} malformed), "
+                 f"{stats['relevant']} relevant, {stats['inserted']} inserted, {stats['skipped']} skipped "
+                 f"in {elapsed:.1f}s")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest relevant papers from a local arXiv metadata snapshot")
+    parser.add_argument('snapshot', help="Path to the JSON-lines snapshot (optionally .gz)")
+    parser.add_argument('--workers', type=int, default=None, help="Parse/filter processes (default: all cores)")
+    parser.add_argument('--chunk-lines', type=int, default=5000, help="Lines per worker task")
+    args = parser.parse_args()
+    setup_logging()
+
+    stats = ingest_snapshot(args.snapshot, workers=args.workers, chunk_lines=args.chunk_lines)
+    print(f"Read {stats['records']} records: {stats['relevant']} relevant, "
+          f"{stats['inserted']} inserted, {stats['skipped']} already in the database")
+
+
+if __name__ == "__main__":
+    main()
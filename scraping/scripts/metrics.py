@@ -0,0 +1,205 @@
+"""
+Run-level performance metrics for the extractor.
+
+Every run of arxiv_extractor_db.run_extraction appends one JSON object to the metrics file (config `metrics_file`,
+default ../logs/run_metrics.jsonl) with:
+    - per-query latency, result pages, retries, results and errors
+    - API requests sent to the network and served from the response cache
+    - the counts of every pipeline stage (fetched, duplicates, relevant, inserted, skipped, written)
+    - the seconds spent in each stage: waiting for the API (fetch), keyword matching (filter), SQLite (db) and
+      CSV output (write)
+    - derived rates: dedupe rate, relevance pass rate and papers per second
+If `prometheus_file` is configured, the latest run is also written there for node_exporter's textfile collector.
+
+Usage: python metrics.py [--last N]    (compare the most recent runs and flag regressions)
+"""
+import argparse
+import json
+import os
+import statistics
+from datetime import datetime
+
+STAGES = ('fetch', 'filter', 'db', 'write')
+
+# A run is flagged when a metric is this much worse than the median of the runs before it
+REGRESSION_THRESHOLD = 0.25
+
+# Timings below this many seconds are too noisy to flag
+MIN_FLAGGED_SECONDS = 1.0
+
+
+def _ratio(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else None
+
+
+def build_record(started, finished, topics, counts, timings, query_stats, cache_hits=0, network_requests=0):
+    """
+    Assemble the metrics of one run.
+    :param started: Start of the run (datetime)
+    :param finished: End of the run (datetime)
+    :param topics: Names of the topics that were run
+    :param counts: Counter filled by the pipeline stages
+    :param timings: Counter of seconds per stage filled by the pipeline stages
+    :param query_stats: Dictionary filled by concurrent_fetch.stream_queries
+    :return: Dictionary, JSON-serialisable
+    """
+    duration = (finished - started).total_seconds()
+    unique = counts['fetched'] - counts['duplicates']
+    return {
+        'started_at': started.isoformat(timespec='seconds'),
+        'finished_at': finished.isoformat(timespec='seconds'),
+        'duration_seconds': round(duration, 3),
+        'topics': list(topics),
+        'queries': query_stats,
+        'pages': sum(stats['pages'] for stats in query_stats.values()),
+        'retries': sum(stats['retries'] for stats in query_stats.values()),
+        'failed_queries': sum(1 for stats in query_stats.values() if stats['error']),
+        'network_requests': network_requests,
+        'cache_hits': cache_hits,
+        'counts': dict(counts),
+        'stage_seconds': {stage: round(timings[stage], 3) for stage in STAGES},
+        'dedupe_rate': _ratio(counts['duplicates'], counts['fetched']),
+        'relevance_pass_rate': _ratio(counts['relevant'], unique),
+        'papers_per_second': _ratio(counts['fetched'], duration),
+    }
+
+
+def append_jsonl(path, record):
+    """Append one run to the JSON-lines metrics file"""
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_prometheus(path, record):
+    """
+    Write the latest run in the Prometheus text exposition format. The file is replaced atomically,
+    as the textfile collector requires.
+    """
+    lines = []
+
+    def metric(name, help_text, samples):
+        lines.append(f"# HELP arxiv_extractor_{name} {help_text}")
+        lines.append(f"# TYPE arxiv_extractor_{name} gauge")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{_label(val)}"' for key, val in labels.items())
+            lines.append(f"arxiv_extractor_{name}{{{label_text}}} {value}" if label_text
+                         else f"arxiv_extractor_{name} {value}")
+
+    metric('last_run_timestamp_seconds', "End of the last run (unix time)",
+           [({}, datetime.fromisoformat(record['finished_at']).timestamp())])
+    metric('run_duration_seconds', "Wall time of the last run", [({}, record['duration_seconds'])])
+    metric('stage_seconds', "Seconds spent in each pipeline stage in the last run",
+           [({'stage': stage}, seconds) for stage, seconds in record['stage_seconds'].items()])
+    metric('papers', "Papers counted by each pipeline stage in the last run",
+           [({'stage': key}, value) for key, value in record['counts'].items() if ':' not in key])
+    metric('topic_papers', "Relevant and written papers per topic in the last run",
+           [({'topic': key.split(':', 1)[1], 'stage': key.split(':', 1)[0]}, value)
+            for key, value in record['counts'].items() if ':' in key])
+    metric('requests', "API requests of the last run by source",
+           [({'source': 'network'}, record['network_requests']), ({'source': 'cache'}, record['cache_hits'])])
+    metric('query_seconds', "Latency of each query in the last run",
+           [({'query': query}, stats['seconds']) for query, stats in record['queries'].items()])
+    metric('query_pages', "Result pages fetched by each query in the last run",
+           [({'query': query}, stats['pages']) for query, stats in record['queries'].items()])
+    metric('failed_queries', "Queries that failed in the last run", [({}, record['failed_queries'])])
+    metric('relevance_pass_rate', "Share of unique papers that were relevant in the last run",
+           [({}, record['relevance_pass_rate'] or 0)])
+    metric('papers_per_second', "Fetched papers per second of wall time in the last run",
+           [({}, record['papers_per_second'] or 0)])
+
+    tmp_file = path + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_file, path)
+
+
+def load_runs(path):
+    """Read all runs of a metrics file, oldest first. Unreadable lines are skipped."""
+    runs = []
+    if not os.path.exists(path):
+        return runs
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                runs.append(json.loads(line))
+            except ValueError:
+                continue
+    return runs
+
+
+def _trend_values(run):
+    """Metrics compared by the report, with whether a higher value is worse"""
+    return {
+        'duration_seconds': (run['duration_seconds'], True),
+        'fetch_seconds': (run['stage_seconds']['fetch'], True),
+        'filter_seconds': (run['stage_seconds']['filter'], True),
+        'db_seconds': (run['stage_seconds']['db'], True),
+        'papers_per_second': (run['papers_per_second'], False),
+        'relevance_pass_rate': (run['relevance_pass_rate'], False),
+    }
+
+
+def report(runs, last=10):
+    """
+    Print the most recent runs and compare the latest one with the median of the runs before it.
+    :return: List of regression messages for the latest run
+    """
+    runs = runs[-last:]
+    if not runs:
+        print("No runs recorded yet.")
+        return []
+
+    print(f"{'started':19}  {'secs':>8}  {'fetch':>8}  {'filter':>7}  {'db':>7}  {'fetched':>7}  {'relevant':>8}  "
+          f"{'inserted':>8}  {'pass':>6}  {'papers/s':>8}  {'pages':>5}  {'cache':>5}  {'failed':>6}")
+    for run in runs:
+        counts = run['counts']
+        stages = run['stage_seconds']
+        print(f"{run['started_at']:19}  {run['duration_seconds']:8.1f}  {stages['fetch']:8.1f}  "
+              f"{stages['filter']:7.2f}  {stages['db']:7.2f}  {counts.get('fetched', 0):7}  "
+              f"{counts.get('relevant', 0):8}  {counts.get('inserted', 0):8}  {run['relevance_pass_rate'] or 0:6.1%}  "
+              f"{run['papers_per_second'] or 0:8.1f}  {run['pages']:5}  {run['cache_hits']:5}  "
+              f"{run['failed_queries']:6}")
+
+    regressions = []
+    if len(runs) > 1:
+        latest = _trend_values(runs[-1])
+        previous = [_trend_values(run) for run in runs[:-1]]
+        print(f"\nLatest run compared with the median of the {len(previous)} runs before it:")
+        for name, (value, higher_is_worse) in latest.items():
+            history = [values[name][0] for values in previous if values[name][0] is not None]
+            if value is None or not history:
+                continue
+            median = statistics.median(history)
+            change = (value - median) / median if median else 0.0
+            flag = ''
+            noise = name.endswith('_seconds') and max(value, median) < MIN_FLAGGED_SECONDS
+            if (change if higher_is_worse else -change) > REGRESSION_THRESHOLD and not noise:
+                flag = '  <-- regression'
+                regressions.append(f"{name}: {value:g} vs median {median:g} ({change:+.0%})")
+            print(f"  {name:20} {value:10.3f}  median {median:10.3f}  {change:+7.0%}{flag}")
+
+        slow = sorted(runs[-1]['queries'].items(), key=lambda item: item[1]['seconds'], reverse=True)[:3]
+        print("\nSlowest queries of the latest run:")
+        for query, stats in slow:
+            print(f"  {stats['seconds']:8.1f}s  {stats['pages']:3} pages  {stats['results']:5} results  {query}")
+    return regressions
+
+
+def main():
+    # Imported here so the module can be used without loading the extractor's configuration
+    from arxiv_extractor_db import METRICS_FILE
+
+    parser = argparse.ArgumentParser(description="Compare the performance of recent extractor runs")
+    parser.add_argument('--file', default=METRICS_FILE, help="JSON-lines metrics file")
+    parser.add_argument('--last', type=int, default=10, help="Number of recent runs to show")
+    args = parser.parse_args()
+
+    report(load_runs(args.file), last=args.last)
+
+
+if __name__ == "__main__":
+    main()
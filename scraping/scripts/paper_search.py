@@ -0,0 +1,210 @@
+"""
+SQLite FTS5 full-text index over the title and abstract of the papers table.
+
+`papers_fts` is an external-content FTS5 table kept in sync with `papers` by triggers, so every insert, upsert or
+delete done by the scrapers is indexed immediately. Keyword and phrase queries then run inside SQLite with bm25
+ranking.
+
+FTS5 matches whole tokens, where the relevance check of the scrapers (relevance.KeywordMatcher) matches substrings
+("transformer" matches "transformers", "GPT" matches "ChatGPT"). The two-tier must_include/optional_keywords check
+therefore runs against `papers_trigram`, a second index with the trigram tokenizer (SQLite 3.34+) over
+title + " " + abstract, whose phrases match case-insensitive substrings. Its candidates are re-checked with
+KeywordMatcher, so the result is exactly the set of papers the scrapers consider relevant. Without the trigram
+index (or with keywords shorter than 3 characters) the check scans the papers table in Python instead.
+
+After a VACUUM, which may renumber the rowids of `papers`, run with --rebuild.
+
+Usage:
+    python paper_search.py '"task planning" AND PDDL' [--limit N]
+    python paper_search.py --relevant [--topic NAME] [--since 2024-01-01] [--limit N]
+    python paper_search.py --rebuild
+"""
+import argparse
+import logging
+import sqlite3
+
+from relevance import KeywordMatcher
+
+
+def init_fts(conn):
+    """Create the FTS5 table and its sync triggers if needed, and index existing papers the first time"""
+    c = conn.cursor()
+    try:
+        c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts
+                     USING fts5(title, abstract, content='papers', content_rowid='rowid')''')
+    except sqlite3.OperationalError as e:
+        logging.warning(f"Full-text index not available (SQLite built without FTS5?): {str(e)}")
+        return False
+    c.executescript('''
+        CREATE TRIGGER IF NOT EXISTS papers_fts_insert AFTER INSERT ON papers BEGIN
+            INSERT INTO papers_fts (rowid, title, abstract) VALUES (new.rowid, new.title, new.abstract);
+        END;
+        CREATE TRIGGER IF NOT EXISTS papers_fts_delete AFTER DELETE ON papers BEGIN
+            INSERT INTO papers_fts (papers_fts, rowid, title, abstract)
+            VALUES ('delete', old.rowid, old.title, old.abstract);
+        END;
+        CREATE TRIGGER IF NOT EXISTS papers_fts_update AFTER UPDATE OF title, abstract ON papers BEGIN
+            INSERT INTO papers_fts (papers_fts, rowid, title, abstract)
+            VALUES ('delete', old.rowid, old.title, old.abstract);
+            INSERT INTO papers_fts (rowid, title, abstract) VALUES (new.rowid, new.title, new.abstract);
+        END;
+    ''')
+    # An empty index next to a non-empty table means the index was just created
+    if c.execute("SELECT COUNT(*) FROM papers_fts_docsize").fetchone()[0] == 0 and \
+            c.execute("SELECT EXISTS (SELECT 1 FROM papers)").fetchone()[0]:
+        rebuild_fts(conn)
+    init_trigram(conn)
+    conn.commit()
+    return True
+
+
+def init_trigram(conn):
+    """Create the trigram index used by the relevance check and its sync triggers, indexing existing papers once"""
+    c = conn.cursor()
+    # The text the scrapers match keywords against, as one column
+    c.execute('''CREATE VIEW IF NOT EXISTS papers_text AS
+                 SELECT rowid AS paper_rowid, COALESCE(title, '') || ' ' || COALESCE(abstract, '') AS text
+                 FROM papers''')
+    try:
+        c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS papers_trigram
+                     USING fts5(text, content='papers_text', content_rowid='paper_rowid', tokenize='trigram')''')
+    except sqlite3.OperationalError as e:
+        logging.warning(f"Trigram index not available (SQLite older than 3.34?): {str(e)}")
+        return False
+    c.executescript('''
+        CREATE TRIGGER IF NOT EXISTS papers_trigram_insert AFTER INSERT ON papers BEGIN
+            INSERT INTO papers_trigram (rowid, text)
+            VALUES (new.rowid, COALESCE(new.title, '') || ' ' || COALESCE(new.abstract, ''));
+        END;
+        CREATE TRIGGER IF NOT EXISTS papers_trigram_delete AFTER DELETE ON papers BEGIN
+            INSERT INTO papers_trigram (papers_trigram, rowid, text)
+            VALUES ('delete', old.rowid, COALESCE(old.title, '') || ' ' || COALESCE(old.abstract, ''));
+        END;
+        CREATE TRIGGER IF NOT EXISTS papers_trigram_update AFTER UPDATE OF title, abstract ON papers BEGIN
+            INSERT INTO papers_trigram (papers_trigram, rowid, text)
+            VALUES ('delete', old.rowid, COALESCE(old.title, '') || ' ' || COALESCE(old.abstract, ''));
+            INSERT INTO papers_trigram (rowid, text)
+            VALUES (new.rowid, COALESCE(new.title, '') || ' ' || COALESCE(new.abstract, ''));
+        END;
+    ''')
+    if c.execute("SELECT COUNT(*) FROM papers_trigram_docsize").fetchone()[0] == 0 and \
+            c.execute("SELECT EXISTS (SELECT 1 FROM papers)").fetchone()[0]:
+        logging.info("Building trigram index over papers")
+        c.execute("INSERT INTO papers_trigram (papers_trigram) VALUES ('rebuild')")
+    conn.commit()
+    return True
+
+
+def has_trigram(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'papers_trigram'").fetchone() is not None
+
+
+def rebuild_fts(conn):
+    """Re-index every paper from scratch"""
+    logging.info("Rebuilding full-text index over papers")
+    conn.execute("INSERT INTO papers_fts (papers_fts) VALUES ('rebuild')")
+    if has_trigram(conn):
+        conn.execute("INSERT INTO papers_trigram (papers_trigram) VALUES ('rebuild')")
+    conn.commit()
+
+
+def phrase(keyword):
+    """Quote a keyword as an FTS5 phrase"""
+    return '"' + keyword.replace('"', '""') + '"'
+
+
+def keyword_query(must_include, optional_keywords):
+    """Build the FTS5 query for the two-tier relevance check: any must_include phrase AND any optional phrase"""
+    return f"({' OR '.join(map(phrase, must_include))}) AND ({' OR '.join(map(phrase, optional_keywords))})"
+
+
+def search(conn, match_query, since=None, limit=None):
+    """
+    Run an FTS5 query (words, "phrases", AND/OR/NOT, NEAR, column filters) against titles and abstracts.
+    :param since: Only return papers published on or after this YYYY-MM-DD date
+    :param limit: Maximum number of results
+    :return: List of (id, title, published_date, score) tuples, best match first (lower bm25 score is better)
+    """
+    sql = '''SELECT p.id, p.title, p.published_date, bm25(papers_fts) AS score
+             FROM papers_fts JOIN papers p ON p.rowid = papers_fts.rowid
+             WHERE papers_fts MATCH ?'''
+    params = [match_query]
+    if since:
+        sql += " AND p.published_date >= ?"
+        params.append(since)
+    sql += " ORDER BY score"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return conn.execute(sql, params).fetchall()
+
+
+def relevant_papers(conn, must_include, optional_keywords, since=None, limit=None):
+    """
+    Re-run the relevance filter for the given keyword lists over the whole local store, with the same substring
+    semantics as KeywordMatcher.
+    :return: List of (id, title, published_date, score) tuples, best match first. Without the trigram index the
+             score is 0 and papers come newest first.
+    """
+    matcher = KeywordMatcher(must_include, optional_keywords)
+    if has_trigram(conn) and min(map(len, list(must_include) + list(optional_keywords)), default=0) >= 3:
+        sql = '''SELECT p.id, p.title, p.abstract, p.published_date, bm25(papers_trigram) AS score
+                 FROM papers_trigram JOIN papers p ON p.rowid = papers_trigram.rowid
+                 WHERE papers_trigram MATCH ?'''
+        params = [keyword_query(must_include, optional_keywords)]
+    else:
+        # Trigrams can't find keywords shorter than 3 characters
+        sql = "SELECT p.id, p.title, p.abstract, p.published_date, 0.0 AS score FROM papers p WHERE 1"
+        params = []
+    if since:
+        sql += " AND p.published_date >= ?"
+        params.append(since)
+    sql += " ORDER BY score, p.published_date DESC"
+    results = []
+    for paper_id, title, abstract, published_date, score in conn.execute(sql, params):
+        # The trigram index folds case a little differently from str.lower(); the matcher has the final say
+        if matcher.is_relevant((title or '') + " " + (abstract or '')):
+            results.append((paper_id, title, published_date, score))
+            if limit and len(results) >= limit:
+                break
+    return results
+
+
+def main():
+    # Imported here so the module can be used without loading the extractor's configuration
+    from arxiv_extractor_db import TOPICS, init_db
+
+    parser = argparse.ArgumentParser(description="Full-text search over the local papers database")
+    parser.add_argument('query', nargs='?', help="FTS5 query, e.g. '\"task planning\" AND PDDL'")
+    parser.add_argument('--relevant', action='store_true',
+                        help="Use the must_include/optional_keywords lists of a configured topic as the query")
+    parser.add_argument('--topic', default=TOPICS[0].name, choices=[topic.name for topic in TOPICS],
+                        help="Topic used by --relevant (default: the first configured topic)")
+    parser.add_argument('--since', help="Only papers published on or after this date (YYYY-MM-DD)")
+    parser.add_argument('--limit', type=int, default=20, help="Maximum number of results (0 for all)")
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild the full-text index")
+    args = parser.parse_args()
+
+    conn = init_db()
+    if args.rebuild:
+        rebuild_fts(conn)
+    if args.relevant:
+        topic = next(topic for topic in TOPICS if topic.name == args.topic)
+        results = relevant_papers(conn, topic.must_include, topic.optional_keywords, since=args.since,
+                                  limit=args.limit)
+    elif args.query:
+        results = search(conn, args.query, since=args.since, limit=args.limit)
+    else:
+        if not args.rebuild:
+            parser.error("either a query, --relevant or --rebuild is required")
+        results = []
+
+    for paper_id, title, published_date, score in results:
+        print(f"{score:8.3f}  {published_date}  {paper_id}  {title}")
+    if args.query or args.relevant:
+        print(f"{len(results)} papers found")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
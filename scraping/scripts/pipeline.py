@@ -0,0 +1,197 @@
+"""
+Composable generator stages for the scrapers: fetch -> dedupe -> relevance (or topic) filter -> DB upsert -> CSV writer.
+Each stage consumes an iterable of arxiv.Result and yields them one at a time, so only the papers currently
+in flight are held in memory. Stages take an optional `counts` Counter that they update as papers pass through,
+and an optional `timings` Counter that accumulates the seconds spent in the stage's own work (fetch, filter, db,
+write), so a slow run can be attributed to the API, the filtering or SQLite.
+"""
+import csv
+import re
+import time
+from datetime import datetime
+
+import arxiv
+
+from bulk_ingest import paper_to_row, upsert_rows
+from concurrent_fetch import stream_queries
+from topics import tag_papers
+
+CSV_HEADER = ['Title', 'Authors', 'Published Date', 'Abstract', 'URL', 'Categories']
+
+
+def _count(counts, key, n=1):
+    if counts is not None:
+        counts[key] += n
+
+
+def _time(timings, key, start):
+    if timings is not None:
+        timings[key] += time.perf_counter() - start
+
+
+def fetch(queries, max_results=200, sort_by=arxiv.SortCriterion.Relevance, counts=None, timings=None, **kwargs):
+    """
+    Stream the results of all queries as they arrive (see concurrent_fetch.stream_queries for kwargs).
+    The 'fetch' timing is the time spent waiting for the next result.
+    Closing this generator stops the fetch workers right away.
+    """
+    papers = stream_queries(queries, max_results=max_results, sort_by=sort_by, **kwargs)
+    try:
+        while True:
+            start = time.perf_counter()
+            paper = next(papers, None)
+            _time(timings, 'fetch', start)
+            if paper is None:
+                return
+            _count(counts, 'fetched')
+            yield paper
+    finally:
+        papers.close()
+
+
+def dedupe(papers, seen=None, counts=None):
+    """Drop papers whose entry_id was already yielded. Only the ids are remembered, not the papers."""
+    seen = set() if seen is None else seen
+    for paper in papers:
+        if paper.entry_id in seen:
+            _count(counts, 'duplicates')
+            continue
+        seen.add(paper.entry_id)
+        yield paper
+
+
+def relevance_filter(papers, predicate, counts=None, timings=None):
+    """Keep papers for which predicate(paper) is true"""
+    for paper in papers:
+        start = time.perf_counter()
+        relevant = predicate(paper)
+        _time(timings, 'filter', start)
+        if relevant:
+            _count(counts, 'relevant')
+            yield paper
+
+
+def topic_filter(papers, engine, tags, counts=None, timings=None):
+    """
+    Match every paper against all topics of a TopicEngine in one scan, and keep papers relevant to any topic.
+    The matching topic names are stored in tags[entry_id].
+    """
+    for paper in papers:
+        start = time.perf_counter()
+        names = engine.match_paper(paper)
+        _time(timings, 'filter', start)
+        if names:
+            tags[paper.entry_id] = names
+            _count(counts, 'relevant')
+            for name in names:
+                _count(counts, f'relevant:{name}')
+            yield paper
+
+
+def db_upsert(papers, conn, batch_size=500, tags=None, counts=None, timings=None):
+    """
+    Upsert papers into the papers table in batches, each batch in its own transaction,
+    and yield only the papers that were not in the database yet.
+    :param tags: Optional dictionary of entry_id -> topic names (see topic_filter), stored in paper_topics in the
+                 same transaction. Papers already in the database are tagged as well.
+    """
+    def flush(batch):
+        start = time.perf_counter()
+        with conn:
+            inserted, skipped = upsert_rows(conn, [paper_to_row(paper) for paper in batch])
+            if tags is not None:
+                tag_papers(conn, {paper.entry_id: tags[paper.entry_id] for paper in batch},
+                           datetime.now().isoformat())
+        _time(timings, 'db', start)
+        _count(counts, 'inserted', len(inserted))
+        _count(counts, 'skipped', skipped)
+        inserted = set(inserted)
+        return [paper for paper in batch if paper.entry_id in inserted]
+
+    batch = []
+    for paper in papers:
+        batch.append(paper)
+        if len(batch) >= batch_size:
+            yield from flush(batch)
+            batch = []
+    if batch:
+        yield from flush(batch)
+
+
+def paper_to_csv_row(paper):
+    """Convert an arxiv.Result into a row of the scrapers' CSV output"""
+    return [
+        paper.title,
+        ', '.join([author.name for author in paper.authors]),
+        paper.published.strftime('%Y-%m-%d'),
+        re.sub(r'\s+', ' ', paper.summary).strip(),
+        paper.entry_id,
+        ', '.join(paper.categories)
+    ]
+
+
+def write_csv(papers, csv_filename, create_empty=False, counts=None, timings=None):
+    """
+    Write papers to a CSV file as they arrive, flushing after every row.
+    :param create_empty: Create the file (header only) even if no papers arrive. Otherwise it is only
+                         created when the first paper arrives.
+    :return: Number of papers written
+    """
+    file = None
+    written = 0
+    try:
+        for paper in papers:
+            start = time.perf_counter()
+            if file is None:
+                file = open(csv_filename, mode='w', newline='', encoding='utf-8')
+                writer = csv.writer(file)
+                writer.writerow(CSV_HEADER)
+            writer.writerow(paper_to_csv_row(paper))
+            file.flush()
+            _time(timings, 'write', start)
+            written += 1
+        if file is None and create_empty:
+            with open(csv_filename, mode='w', newline='', encoding='utf-8') as empty:
+                csv.writer(empty).writerow(CSV_HEADER)
+    finally:
+        if file is not None:
+            file.close()
+    _count(counts, 'written', written)
+    return written
+
+
+def write_topic_csvs(papers, tags, csv_filenames, create_empty=False, counts=None, timings=None):
+    """
+    Write each paper to the CSV file of every topic it is tagged with, flushing after every row.
+    :param tags: Dictionary of entry_id -> topic names (see topic_filter)
+    :param csv_filenames: Dictionary of topic name -> CSV file name
+    :param create_empty: Create the files of topics without papers (header only). Otherwise a file is only
+                         created when its first paper arrives.
+    :return: Dictionary of topic name -> number of papers written
+    """
+    files = {}
+    written = {name: 0 for name in csv_filenames}
+    try:
+        for paper in papers:
+            start = time.perf_counter()
+            row = paper_to_csv_row(paper)
+            for name in tags[paper.entry_id]:
+                if name not in files:
+                    file = open(csv_filenames[name], mode='w', newline='', encoding='utf-8')
+                    files[name] = (file, csv.writer(file))
+                    files[name][1].writerow(CSV_HEADER)
+                file, writer = files[name]
+                writer.writerow(row)
+                file.flush()
+                written[name] += 1
+                _count(counts, f'written:{name}')
+            _time(timings, 'write', start)
+            _count(counts, 'written')
+        if create_empty:
+            for name in csv_filenames.keys() - files.keys():
+                with open(csv_filenames[name], mode='w', newline='', encoding='utf-8') as empty:
+                    csv.writer(empty).writerow(CSV_HEADER)
+    finally:
+        for file, writer in files.values():
+            file.close()
+    return written
@@ -0,0 +1,285 @@
+"""
+Query planner for arXiv search queries.
+
+Parses boolean query strings such as 'cat:cs.AI AND ("LLMs" OR "GPT") AND planning', drops queries whose
+results are contained in another query's results and merges queries that differ in a single AND clause
+(`X AND A` + `X AND B` -> `X AND (A OR B)`). The planned set returns the same union of papers with fewer API calls,
+as long as no query's result window is cut off by `max_results` (e.g. incremental mode once watermarks exist).
+"""
+import logging
+import re
+from collections import namedtuple
+
+# Result of planning: the query to send and the original queries whose results it covers
+PlannedQuery = namedtuple('PlannedQuery', ['query', 'sources'])
+
+# Above this many conjunctions a query is not compared for subsumption
+MAX_DNF_SIZE = 256
+
+# Merged queries end up in the request URL, so keep them reasonably short
+MAX_QUERY_LENGTH = 1000
+
+_TOKEN_RE = re.compile(r'\s*(\(|\)|"[^"]*"|[^\s()"]+(?:"[^"]*")?)')
+_OPERATORS = {'AND', 'OR', 'ANDNOT'}
+
+
+class Term:
+    def __init__(self, field, value, display):
+        self.field = field
+        self.value = value
+        self.display = display
+
+    def key(self):
+        return 'term', self.field, self.value.lower()
+
+
+class And:
+    def __init__(self, children):
+        self.children = children
+
+    def key(self):
+        return 'and', tuple(sorted(child.key() for child in self.children))
+
+
+class Or:
+    def __init__(self, children):
+        self.children = children
+
+    def key(self):
+        return 'or', tuple(sorted(child.key() for child in self.children))
+
+
+class Not:
+    def __init__(self, child):
+        self.child = child
+
+    def key(self):
+        return 'not', self.child.key()
+
+
+def tokenize(query):
+    tokens = []
+    position = 0
+    query = query.strip()
+    while position < len(query):
+        match = _TOKEN_RE.match(query, position)
+        if not match:
+            raise ValueError(f"Cannot tokenize query at position {position}: {query}")
+        tokens.append(match.group(1))
+        position = match.end()
+    return tokens
+
+
+def parse(query):
+    """
+    Parse an arXiv query string. OR binds loosest, AND and ANDNOT bind tighter, parentheses group.
+    :raise ValueError: If the query uses syntax the planner does not understand
+    """
+    tokens = tokenize(query)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or():
+        children = [parse_and()]
+        while peek() == 'OR':
+            take()
+            children.append(parse_and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def parse_and():
+        children = [parse_atom()]
+        while peek() in ('AND', 'ANDNOT'):
+            operator = take()
+            atom = parse_atom()
+            children.append(Not(atom) if operator == 'ANDNOT' else atom)
+        return children[0] if len(children) == 1 else And(children)
+
+    def parse_atom():
+        token = peek()
+        if token is None or token == ')' or token in _OPERATORS:
+            raise ValueError(f"Unexpected {token!r} in query: {query}")
+        take()
+        if token == '(':
+            node = parse_or()
+            if peek() != ')':
+                raise ValueError(f"Unbalanced parentheses in query: {query}")
+            take()
+            return node
+        field, _, value = token.rpartition(':') if ':' in token and not token.startswith('"') else ('', '', token)
+        return Term(field or None, value.strip('"'), token)
+
+    node = parse_or()
+    if peek() is not None:
+        raise ValueError(f"Unexpected {peek()!r} in query: {query}")
+    return flatten(node)
+
+
+def flatten(node):
+    """Merge nested ANDs into their parent AND and nested ORs into their parent OR"""
+    if isinstance(node, (And, Or)):
+        children = []
+        for child in map(flatten, node.children):
+            children.extend(child.children if type(child) is type(node) else [child])
+        return type(node)(children)
+    if isinstance(node, Not):
+        return Not(flatten(node.child))
+    return node
+
+
+def render(node, parent=None):
+    """Turn a parsed query back into an arXiv query string"""
+    if isinstance(node, Term):
+        return node.display
+    if isinstance(node, Not):
+        return render(node.child, node)
+    if isinstance(node, And):
+        text = render(node.children[0], node)
+        for child in node.children[1:]:
+            text += (' ANDNOT ' if isinstance(child, Not) else ' AND ') + render(child, node)
+        return f'({text})' if parent is not None else text
+    text = ' OR '.join(render(child, node) for child in node.children)
+    return f'({text})' if parent is not None else text
+
+
+def _literal(term):
+    """Positive literal: the field plus the lowercased token sequence of the term"""
+    field = None if term.field in (None, 'all') else term.field.lower()
+    return '+', field, tuple(term.value.lower().split())
+
+
+def dnf(node):
+    """
+    Convert a parsed query into disjunctive normal form: a list of conjunctions, each a frozenset of literals.
+    Negated sub-queries are kept as opaque literals that only match themselves.
+    :raise ValueError: If the normal form grows beyond MAX_DNF_SIZE conjunctions
+    """
+    if isinstance(node, Term):
+        return [frozenset([_literal(node)])]
+    if isinstance(node, Not):
+        return [frozenset([('-', node.child.key())])]
+    if isinstance(node, Or):
+        result = [conjunction for child in node.children for conjunction in dnf(child)]
+    else:
+        result = [frozenset()]
+        for child in node.children:
+            result = [left | right for left in result for right in dnf(child)]
+            if len(result) > MAX_DNF_SIZE:
+                raise ValueError("Query too large to normalise")
+    if len(result) > MAX_DNF_SIZE:
+        raise ValueError("Query too large to normalise")
+    return result
+
+
+def literal_implies(specific, general):
+    """
+    A document matching `specific` also matches `general` if both are the same literal, or both are positive
+    terms on the same field and the general term's tokens appear contiguously in the specific term
+    (the phrase "task planning" implies the word planning).
+    """
+    if specific == general:
+        return True
+    if specific[0] != '+' or general[0] != '+' or specific[1] != general[1]:
+        return False
+    tokens, sub = specific[2], general[2]
+    return any(tokens[i:i + len(sub)] == sub for i in range(len(tokens) - len(sub) + 1))
+
+
+def query_implies(specific, general):
+    """Every result of the `specific` DNF is a result of the `general` DNF (sound, not complete)"""
+    return all(
+        any(all(any(literal_implies(s, g) for s in conjunction) for g in other) for other in general)
+        for conjunction in specific
+    )
+
+
+def _clauses(node):
+    return list(node.children) if isinstance(node, And) else [node]
+
+
+def _merge(left, right):
+    """Merge two queries that share all top-level AND clauses but one, or return None"""
+    left_clauses, right_clauses = _clauses(left), _clauses(right)
+    if len(left_clauses) != len(right_clauses) or len(left_clauses) < 2:
+        return None
+    right_keys = [clause.key() for clause in right_clauses]
+    differing = []
+    for clause in left_clauses:
+        if clause.key() in right_keys:
+            right_keys.remove(clause.key())
+        else:
+            differing.append(clause)
+    if len(differing) != 1 or isinstance(differing[0], Not):
+        return None
+    other = next(clause for clause in right_clauses if clause.key() == right_keys[0])
+    if isinstance(other, Not):
+        return None
+    merged = [flatten(Or([clause, other])) if clause is differing[0] else clause for clause in left_clauses]
+    return And(merged)
+
+
+def plan_queries(queries):
+    """
+    Reduce a list of queries to a minimal set of API searches.
+    :param queries: List of arXiv query strings
+    :return: List of PlannedQuery(query, sources), where `sources` lists the original queries covered by `query`.
+             Queries the planner cannot parse are passed through unchanged.
+    """
+    parsed = {}
+    for query in dict.fromkeys(queries):
+        try:
+            node = parse(query)
+            parsed[query] = (node, dnf(node))
+        except ValueError as e:
+            logging.warning(f"Query planner leaves query unchanged: {str(e)}")
+            parsed[query] = (None, None)
+
+    # Drop queries implied by another query. Of two equivalent queries the first one is kept.
+    order = list(parsed)
+    covered_by = {}
+    for i, query in enumerate(order):
+        node, normal = parsed[query]
+        if normal is None:
+            continue
+        for j, other in enumerate(order):
+            other_normal = parsed[other][1]
+            if i == j or other_normal is None or other in covered_by:
+                continue
+            if query_implies(normal, other_normal) and (j < i or not query_implies(other_normal, normal)):
+                covered_by[query] = other
+                break
+
+    def root(query):
+        while query in covered_by:
+            query = covered_by[query]
+        return query
+
+    plans = [[parsed[query][0], [q for q in order if root(q) == query], query]
+             for query in order if query not in covered_by]
+
+    # Merge queries differing in a single AND clause until nothing changes
+    merged_any = True
+    while merged_any:
+        merged_any = False
+        for i in range(len(plans)):
+            for j in range(i + 1, len(plans)):
+                if plans[i][0] is None or plans[j][0] is None:
+                    continue
+                merged = _merge(plans[i][0], plans[j][0])
+                if merged is not None and len(render(merged)) <= MAX_QUERY_LENGTH:
+                    plans[i] = [merged, plans[i][1] + plans[j][1], render(merged)]
+                    del plans[j]
+                    merged_any = True
+                    break
+            if merged_any:
+                break
+
+    planned = [PlannedQuery(query, sources) for _, sources, query in plans]
+    logging.info(f"Query planner reduced {len(dict.fromkeys(queries))} queries to {len(planned)} API searches")
+    return planned
@@ -0,0 +1,35 @@
+import threading
+import time
+
+# arXiv asks API clients to make no more than one request every three seconds
+ARXIV_REQUEST_INTERVAL = 3.0
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by every worker that talks to the same API.
+    Tokens are refilled at `rate` per second up to `capacity`; each request takes one.
+    """
+
+    def __init__(self, rate=1.0 / ARXIV_REQUEST_INTERVAL, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        """Block until a token is available, then take it"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,92 @@
+import re
+from functools import lru_cache
+
+
+class KeywordMatcher:
+    """
+    Precompiled two-tier keyword matcher. All keywords of both lists are compiled once into a single
+    alternation regex, so each document is lowercased once and scanned in a single pass.
+    A document is relevant if it contains at least one `must_include` and one `optional_keywords` keyword.
+
+    The alternation sits inside a lookahead, so it is tried at every position without consuming text: keywords that
+    overlap (e.g. "language model" and "model based planning" in "language model based planning") are all found.
+    At each position the longest keyword wins, and the shorter keywords it starts with are credited through
+    `contained`, so every keyword occurring in the text is found, as with `keyword in text`.
+    """
+
+    def __init__(self, must_include, optional_keywords, word_boundaries=False):
+        """
+        :param must_include: Keywords of which at least one must be present
+        :param optional_keywords: Keywords of which at least one must be present as well
+        :param word_boundaries: Only match whole words (e.g. "GPT" no longer matches "GPTs").
+                                The default keeps the plain substring semantics of the original is_relevant.
+        """
+        self.must_include = {keyword.lower() for keyword in must_include}
+        self.optional_keywords = {keyword.lower() for keyword in optional_keywords}
+        keywords = sorted(self.must_include | self.optional_keywords, key=len, reverse=True)
+
+        # Longest alternatives first, so "hierarchical task planning" wins over "task planning" at the same position.
+        # Shorter keywords inside a match are credited through `contained`.
+        alternation = '|'.join(re.escape(keyword) for keyword in keywords)
+        self.pattern = re.compile(rf'(?=\b({alternation})\b)' if word_boundaries else rf'(?=({alternation}))')
+        if word_boundaries:
+            self.contained = {keyword: {other for other in keywords if re.search(rf'\b{re.escape(other)}\b', keyword)}
+                              for keyword in keywords}
+        else:
+            self.contained = {keyword: {other for other in keywords if other in keyword} for keyword in keywords}
+
+    def matches(self, text):
+        """Return the set of (lowercased) keywords found in the text"""
+        found = set()
+        for match in self.pattern.finditer(text.lower()):
+            found |= self.contained[match.group(1)]
+        return found
+
+    def is_relevant(self, text):
+        """Check the text against both keyword tiers, stopping as soon as both are satisfied"""
+        has_must = has_optional = False
+        for match in self.pattern.finditer(text.lower()):
+            keywords = self.contained[match.group(1)]
+            has_must = has_must or not keywords.isdisjoint(self.must_include)
+            has_optional = has_optional or not keywords.isdisjoint(self.optional_keywords)
+            if has_must and has_optional:
+                return True
+        return False
+
+    def paper_is_relevant(self, paper):
+        """Check an arxiv.Result based on its title and abstract"""
+        return self.is_relevant(paper.title + " " + paper.summary)
+
+    def match_rows(self, rows):
+        """
+        Filter (id, title, abstract) rows, e.g. straight from a papers table cursor.
+        :return: Generator of (id, set of matched keywords) for the relevant rows
+        """
+        for paper_id, title, abstract in rows:
+            found = self.matches((title or '') + " " + (abstract or ''))
+            if not found.isdisjoint(self.must_include) and not found.isdisjoint(self.optional_keywords):
+                yield paper_id, found
+
+
+@lru_cache(maxsize=None)
+def _cached_matcher(must_include, optional_keywords, word_boundaries):
+    return KeywordMatcher(must_include, optional_keywords, word_boundaries)
+
+
+def get_matcher(must_include, optional_keywords, word_boundaries=False):
+    """Return a compiled matcher for the keyword lists, building it only the first time they are seen"""
+    return _cached_matcher(tuple(must_include), tuple(optional_keywords), word_boundaries)
+
+
+def match_db_rows(conn, matcher, batch_size=10000):
+    """
+    Re-filter the whole papers table with a matcher, reading rows in batches.
+    :return: Generator of (id, set of matched keywords) for the relevant papers
+    """
+    c = conn.cursor()
+    c.execute("SELECT id, title, abstract FROM papers")
+    while True:
+        rows = c.fetchmany(batch_size)
+        if not rows:
+            break
+        yield from matcher.match_rows(rows)
@@ -0,0 +1,187 @@
+"""
+Persistent on-disk cache for arXiv API responses, shared by the scrapers (through RateLimitedClient) and
+abstract_adding/get_abstracts.py (through CachedSession).
+
+Entries live in a small SQLite database keyed by the normalised request URL: scheme-independent, query parameters
+sorted and `id_list` ids sorted, so the same search page or id batch maps to one entry. Entries expire after a TTL
+and the least recently used ones are evicted once the cache grows beyond its size cap.
+Only well-formed Atom feeds are stored, and only if they hold entries or report no results at all: arXiv sometimes
+answers with a spurious empty page, which must be retried rather than replayed from the cache.
+"""
+import contextlib
+import logging
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ET
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+
+# Cache modes: use fresh entries and store misses, never touch the network,
+# always re-fetch and store, or ignore the cache entirely
+DEFAULT, CACHE_ONLY, REFRESH, BYPASS = 'default', 'cache-only', 'refresh', 'bypass'
+CACHE_MODES = (DEFAULT, CACHE_ONLY, REFRESH, BYPASS)
+
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+OPENSEARCH = '{http://a9.com/-/spec/opensearch/1.1/}'
+
+
+class CacheMiss(Exception):
+    """Raised in cache-only mode when a request is not in the cache"""
+
+
+def normalise_url(url):
+    """Build the cache key of a request URL"""
+    parts = urlsplit(url)
+    params = []
+    for key, value in parse_qsl(parts.query, keep_blank_values=True):
+        key = key.strip().lower()
+        if key == 'id_list':
+            value = ','.join(sorted(i.strip() for i in value.split(',') if i.strip()))
+        else:
+            value = ' '.join(value.split())
+        params.append((key, value))
+    return f"{parts.netloc.lower()}{parts.path}?{urlencode(sorted(params))}"
+
+
+def is_cacheable(body):
+    """
+    Check whether a response body is worth caching.
+    :return: True if it is an Atom feed with at least one entry, or one whose totalResults is 0
+    """
+    try:
+        feed = ET.fromstring(body)
+    except ET.ParseError:
+        return False
+    if feed.find(f'{ATOM}entry') is not None:
+        return True
+    total = feed.findtext(f'{OPENSEARCH}totalResults')
+    return total is not None and total.strip() == '0'
+
+
+class ResponseCache:
+    def __init__(self, path, ttl=3600, max_bytes=512 * 1024 * 1024):
+        """
+        :param path: SQLite file holding the cache
+        :param ttl: Seconds after which an entry is stale (None keeps entries until they are evicted).
+                    Keep it shorter than the scraping interval, otherwise scheduled runs see yesterday's pages.
+        :param max_bytes: Size cap for all stored bodies; least recently used entries are evicted beyond it
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS responses
+                              (key TEXT PRIMARY KEY, url TEXT, body BLOB, size INTEGER,
+                               created_at REAL, last_access REAL)''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    def get(self, url):
+        """Return the cached body for the URL, or None if it is missing or stale"""
+        key = normalise_url(url)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT body, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return row[0]
+
+    def put(self, url, body):
+        """Store a response body, then evict least recently used entries if the cache is over its size cap"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute('''INSERT OR REPLACE INTO responses (key, url, body, size, created_at, last_access)
+                                  VALUES (?, ?, ?, ?, ?, ?)''', (normalise_url(url), url, body, len(body), now, now))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logging.info(f"Response cache: evicted {evicted} least recently used entries")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+class CachedSession(requests.Session):
+    """
+    requests.Session whose GET requests go through a ResponseCache. Only real network requests take a token
+    from the optional rate limiter, so cache hits cost neither an API call nor a wait.
+    Inside `refreshing()` the calling thread's requests skip the cache lookup, e.g. while retrying a bad page.
+    """
+
+    def __init__(self, cache=None, mode=DEFAULT, limiter=None):
+        super().__init__()
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode '{mode}', expected one of {', '.join(CACHE_MODES)}")
+        self.cache = cache
+        self.mode = mode if cache is not None else BYPASS
+        self.limiter = limiter
+        # Requests served from the cache and sent to the network, for run metrics
+        self.cache_hits = 0
+        self.network_requests = 0
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def refreshing(self):
+        """Send this thread's requests to the network (and cache the good answers) until the block ends"""
+        previous = getattr(self._local, 'refresh', False)
+        self._local.refresh = True
+        try:
+            yield
+        finally:
+            self._local.refresh = previous
+
+    def get(self, url, params=None, **kwargs):
+        url = requests.Request('GET', url, params=params).prepare().url
+        if self.mode in (DEFAULT, CACHE_ONLY) and not getattr(self._local, 'refresh', False):
+            body = self.cache.get(url)
+            if body is not None:
+                with self._stats_lock:
+                    self.cache_hits += 1
+                return _cached_response(url, body)
+            if self.mode == CACHE_ONLY:
+                raise CacheMiss(f"Not in response cache: {url}")
+
+        if self.limiter is not None:
+            self.limiter.acquire()
+        with self._stats_lock:
+            self.network_requests += 1
+        response = super().get(url, **kwargs)
+        if self.mode != BYPASS and response.status_code == requests.codes.OK and is_cacheable(response.content):
+            self.cache.put(url, response.content)
+        return response
+
+
+def _cached_response(url, body):
+    response = requests.Response()
+    response.status_code = requests.codes.OK
+    response.url = url
+    response._content = body
+    response.encoding = 'utf-8'
+    return response
@@ -0,0 +1,44 @@
+import fcntl
+import os
+
+
+class LockHeld(Exception):
+    pass
+
+
+class RunLock:
+    """
+    Non-blocking exclusive lock on a file, held by at most one process at a time (flock, so it is released
+    automatically if the process dies). Used to keep a cron run and the daemon from scraping at the same time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def acquire(self):
+        """:raise LockHeld: If another process holds the lock"""
+        self.file = open(self.path, 'a+')
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.file.close()
+            self.file = None
+            raise LockHeld(f"Lock {self.path} is held by another process")
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(str(os.getpid()))
+        self.file.flush()
+
+    def release(self):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
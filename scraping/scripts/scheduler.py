@@ -0,0 +1,195 @@
+"""
+Long-running scheduler daemon that replaces one cron entry per extractor run.
+
+The daemon imports arxiv and reads config.json once. It keeps one SQLite connection, one response cache and one
+HTTP session (with a shared rate limiter) open for its whole lifetime, and runs every job of the `daemon` section
+of config.json on its own interval, plus a random jitter so jobs with equal intervals don't fire together.
+
+Every run holds the same lock file as a cron run of arxiv_extractor_db.py, so runs never overlap, and a second
+daemon refuses to start. The state of every job (last start/end, result, counts, next run) is written to a JSON
+status file after each change.
+
+Config (all keys optional):
+    "daemon": {
+        "jitter": 300,
+        "status_file": "../logs/scheduler_status.json",
+        "jobs": [{"name": "llm_planning", "interval": 21600, "topics": ["llm_planning"]}]
+    }
+A job runs the listed topics of the `topics` section (see topics.py) in one shared fetch, or all topics if it
+lists none.
+
+Usage: python scheduler.py [--once]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import signal
+import threading
+import time
+from datetime import datetime
+
+import arxiv_extractor_db as extractor
+from rate_limiter import TokenBucket
+from response_cache import CachedSession, ResponseCache
+from run_lock import LockHeld, RunLock
+
+DAEMON_CONFIG = extractor.config.get('daemon', {})
+JOBS = DAEMON_CONFIG.get('jobs', [{'name': 'default', 'interval': 24 * 3600}])
+JITTER = DAEMON_CONFIG.get('jitter', 300)
+STATUS_FILE = os.path.join(extractor.BASE_DIR, DAEMON_CONFIG.get('status_file', '../logs/scheduler_status.json'))
+DAEMON_LOCK_FILE = extractor.DB_FILE + '.daemon.lock'
+
+# How long to wait before retrying a job whose run was skipped because another run held the lock
+LOCK_RETRY_SECONDS = 300
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat(timespec='seconds') if timestamp else None
+
+
+def _use_log_file_for_today():
+    """Point the root log handler at today's log file, as a fresh cron run would"""
+    filename = os.path.join(extractor.LOG_DIR, f"arxiv_extractor_{datetime.now().strftime('%Y%m%d')}.log")
+    root = logging.getLogger()
+    for handler in root.handlers:
+        if isinstance(handler, logging.FileHandler) and handler.baseFilename != os.path.abspath(filename):
+            handler.close()
+            handler.baseFilename = os.path.abspath(filename)
+
+
+def job_topics(job):
+    """Resolve the topic names of a job, or None for all topics"""
+    if not job.get('topics'):
+        return None
+    topics = {topic.name: topic for topic in extractor.TOPICS}
+    unknown = [name for name in job['topics'] if name not in topics]
+    if unknown:
+        raise ValueError(f"Job '{job['name']}' refers to unknown topics: {', '.join(unknown)}")
+    return [topics[name] for name in job['topics']]
+
+
+class Scheduler:
+    def __init__(self, jobs, jitter=JITTER, status_file=STATUS_FILE):
+        self.jobs = jobs
+        self.jitter = jitter
+        self.status_file = status_file
+        self.stop_event = threading.Event()
+        self.conn = None
+        self.cache = ResponseCache(extractor.CACHE_FILE, ttl=extractor.CACHE_TTL) if extractor.CACHE_FILE else None
+        if self.cache is not None and jobs and extractor.CACHE_TTL is not None \
+                and extractor.CACHE_TTL >= min(job['interval'] for job in jobs):
+            logging.warning(f"cache_ttl ({extractor.CACHE_TTL}s) is not shorter than the shortest job interval "
+                            f"({min(job['interval'] for job in jobs)}s): runs may be served the previous run's pages")
+        self.limiter = TokenBucket()
+        self.session = CachedSession(self.cache, extractor.CACHE_MODE, self.limiter)
+        self.started_at = time.time()
+        self.status = {job['name']: {'interval': job['interval'], 'running': False, 'runs': 0, 'last_start': None,
+                                     'last_end': None, 'last_result': None, 'last_error': None, 'last_counts': None,
+                                     'next_run': None} for job in jobs}
+        self.next_run = {}
+
+    def _schedule(self, job, base, delay):
+        self.next_run[job['name']] = base + delay + random.uniform(0, self.jitter)
+        self.status[job['name']]['next_run'] = _iso(self.next_run[job['name']])
+
+    def write_status(self):
+        """Atomically replace the status file, so readers never see a half-written file"""
+        status = {'pid': os.getpid(), 'started_at': _iso(self.started_at), 'updated_at': _iso(time.time()),
+                  'jobs': self.status}
+        tmp_file = self.status_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(status, f, indent=2)
+        os.replace(tmp_file, self.status_file)
+
+    def run_job(self, job):
+        """Run one job under the run lock, reusing the warm connection, cache and session"""
+        state = self.status[job['name']]
+        lock = RunLock(extractor.LOCK_FILE)
+        try:
+            lock.acquire()
+        except LockHeld as e:
+            logging.warning(f"Scheduler: skipping job '{job['name']}': {str(e)}")
+            state['last_result'] = 'skipped'
+            self._schedule(job, time.time(), LOCK_RETRY_SECONDS)
+            return
+
+        start = time.time()
+        state.update(running=True, last_start=_iso(start))
+        self.write_status()
+        try:
+            _use_log_file_for_today()
+            logging.info(f"Scheduler: starting job '{job['name']}'")
+            if self.conn is None:
+                self.conn = extractor.init_db()
+            counts = extractor.run_extraction(self.conn, self.cache, self.session, self.limiter,
+                                              topics=job_topics(job))
+            state.update(last_result='ok', last_error=None, last_counts=dict(counts))
+        except Exception as e:
+            logging.error(f"Scheduler: job '{job['name']}' failed: {str(e)}")
+            state.update(last_result='error', last_error=str(e))
+            # Reopen the database on the next run in case the connection itself is broken
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+        finally:
+            lock.release()
+            state.update(running=False, last_end=_iso(time.time()), runs=state['runs'] + 1)
+            self._schedule(job, start, job['interval'])
+            logging.info(f"Scheduler: job '{job['name']}' finished in {time.time() - start:.1f}s")
+
+    def run_forever(self, once=False):
+        """Run jobs as they fall due until stop() is called (or after every job ran once)"""
+        for job in self.jobs:
+            self._schedule(job, time.time(), 0)
+        self.write_status()
+        pending = {job['name'] for job in self.jobs}
+
+        while not self.stop_event.is_set() and (pending or not once):
+            job = min(self.jobs, key=lambda j: self.next_run[j['name']])
+            if self.stop_event.wait(max(self.next_run[job['name']] - time.time(), 0)):
+                break
+            self.run_job(job)
+            if self.status[job['name']]['last_result'] != 'skipped':
+                pending.discard(job['name'])
+            self.write_status()
+
+    def stop(self, *args):
+        logging.info("Scheduler: stopping")
+        self.stop_event.set()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+        if self.cache is not None:
+            self.cache.close()
+        self.session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the arXiv extractor jobs of config.json as a daemon")
+    parser.add_argument('--once', action='store_true', help="Run every job once, then exit")
+    args = parser.parse_args()
+    extractor.setup_logging()
+
+    daemon_lock = RunLock(DAEMON_LOCK_FILE)
+    try:
+        daemon_lock.acquire()
+    except LockHeld:
+        print(f"Another scheduler is already running (lock file {DAEMON_LOCK_FILE})")
+        return
+
+    scheduler = Scheduler(JOBS)
+    signal.signal(signal.SIGTERM, scheduler.stop)
+    signal.signal(signal.SIGINT, scheduler.stop)
+    logging.info(f"Scheduler started with jobs: {', '.join(job['name'] for job in JOBS)}")
+    try:
+        scheduler.run_forever(once=args.once)
+    finally:
+        scheduler.close()
+        daemon_lock.release()
+
+
+if __name__ == "__main__":
+    main()
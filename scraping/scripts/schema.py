@@ -0,0 +1,212 @@
+"""
+Normalised schema next to the legacy `papers` table.
+
+`papers` stores one row per versioned entry_id with comma-joined authors and categories. The normalised tables
+key every paper by its canonical arXiv id (without version suffix), so v2/v3 of a paper become rows of
+`article_versions` instead of duplicate papers, and authors and categories become indexed join tables:
+
+    articles (arxiv_id, title, abstract, published_date, latest_version, url)
+    article_versions (arxiv_id, version, entry_id)
+    authors (author_id, name) / article_authors (arxiv_id, author_id, position)
+    categories (category_id, name) / article_categories (arxiv_id, category_id)
+
+bulk_ingest.upsert_rows keeps them in sync with every write to `papers`. `init_schema` creates them and migrates
+an existing database once (tracked with PRAGMA user_version).
+
+`paper_changes` holds one row per paper with a sequence number that triggers bump on every insert or update of
+`papers`, so exports can pick up only the papers changed since their last run.
+
+Usage: python schema.py    (migrate the configured database and print table sizes)
+"""
+import logging
+import re
+
+SCHEMA_VERSION = 2
+
+# SQLite builds before 3.32 allow at most 999 bound parameters per statement
+ID_CHUNK_SIZE = 500
+
+_ENTRY_ID_RE = re.compile(r'(?:arxiv\.org/abs/)?(?P<id>[^/]+/\d+|\d+\.\d+)(?:v(?P<version>\d+))?$')
+
+
+def parse_entry_id(entry_id):
+    """
+    Split an arXiv entry id or abs URL into its canonical id and version number,
+    e.g. 'http://arxiv.org/abs/2212.08681v2' -> ('2212.08681', 2). Ids without a version count as v1.
+    """
+    match = _ENTRY_ID_RE.search(entry_id.strip())
+    if not match:
+        raise ValueError(f"Not an arXiv id: {entry_id}")
+    return match.group('id'), int(match.group('version') or 1)
+
+
+def init_schema(conn):
+    """Create the normalised tables and indexes, migrating the existing papers table the first time"""
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS articles
+            (arxiv_id TEXT PRIMARY KEY, title TEXT, abstract TEXT, published_date TEXT,
+             latest_version INTEGER, url TEXT);
+        CREATE TABLE IF NOT EXISTS article_versions
+            (arxiv_id TEXT, version INTEGER, entry_id TEXT UNIQUE, PRIMARY KEY (arxiv_id, version));
+        CREATE TABLE IF NOT EXISTS authors (author_id INTEGER PRIMARY KEY, name TEXT UNIQUE);
+        CREATE TABLE IF NOT EXISTS article_authors
+            (arxiv_id TEXT, author_id INTEGER, position INTEGER, PRIMARY KEY (arxiv_id, position));
+        CREATE TABLE IF NOT EXISTS categories (category_id INTEGER PRIMARY KEY, name TEXT UNIQUE);
+        CREATE TABLE IF NOT EXISTS article_categories
+            (arxiv_id TEXT, category_id INTEGER, PRIMARY KEY (arxiv_id, category_id));
+
+        CREATE INDEX IF NOT EXISTS idx_papers_published_date ON papers (published_date);
+        CREATE INDEX IF NOT EXISTS idx_articles_published_date ON articles (published_date);
+        CREATE INDEX IF NOT EXISTS idx_article_categories_category ON article_categories (category_id, arxiv_id);
+        CREATE INDEX IF NOT EXISTS idx_article_authors_author ON article_authors (author_id);
+
+        CREATE TABLE IF NOT EXISTS paper_changes (paper_id TEXT PRIMARY KEY, seq INTEGER);
+        CREATE INDEX IF NOT EXISTS idx_paper_changes_seq ON paper_changes (seq);
+        CREATE TRIGGER IF NOT EXISTS papers_change_insert AFTER INSERT ON papers BEGIN
+            INSERT OR REPLACE INTO paper_changes (paper_id, seq)
+            VALUES (new.id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM paper_changes));
+        END;
+        CREATE TRIGGER IF NOT EXISTS papers_change_update AFTER UPDATE ON papers BEGIN
+            INSERT OR REPLACE INTO paper_changes (paper_id, seq)
+            VALUES (new.id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM paper_changes));
+        END;
+        CREATE TRIGGER IF NOT EXISTS papers_change_delete AFTER DELETE ON papers BEGIN
+            DELETE FROM paper_changes WHERE paper_id = old.id;
+        END;
+    ''')
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version < SCHEMA_VERSION:
+        migrate(conn, version)
+    conn.commit()
+
+
+def migrate(conn, from_version=0, batch_size=10000):
+    """Bring a database from `from_version` up to SCHEMA_VERSION using the rows of the legacy papers table"""
+    with conn:
+        if from_version < 1:
+            logging.info("Migrating papers into the normalised schema")
+            c = conn.cursor()
+            c.execute("SELECT id, title, authors, published_date, abstract, url, categories FROM papers")
+            migrated = 0
+            while True:
+                rows = c.fetchmany(batch_size)
+                if not rows:
+                    break
+                normalise_rows(conn, rows)
+                migrated += len(rows)
+            logging.info(f"Migrated {migrated} papers into the normalised schema")
+        if from_version < 2:
+            # Existing papers count as changed once, in insertion order
+            conn.execute("INSERT OR IGNORE INTO paper_changes (paper_id, seq) SELECT id, rowid FROM papers")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def _name_ids(conn, table, id_column, names):
+    """Insert missing names into authors/categories and return a name -> id dictionary"""
+    names = list(dict.fromkeys(names))
+    conn.executemany(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", [(name,) for name in names])
+    ids = {}
+    for start in range(0, len(names), ID_CHUNK_SIZE):
+        chunk = names[start:start + ID_CHUNK_SIZE]
+        ids.update((name, row_id) for row_id, name in conn.execute(
+            f"SELECT {id_column}, name FROM {table} WHERE name IN ({', '.join('?' * len(chunk))})", chunk))
+    return ids
+
+
+def _split(joined):
+    return [part.strip() for part in (joined or '').split(',') if part.strip()]
+
+
+def normalise_rows(conn, rows):
+    """
+    Write rows of the papers table into the normalised tables. Does not commit.
+    The article, its authors and its categories follow the newest version seen; older versions only add
+    a row to article_versions.
+    :param rows: Iterable of (id, title, authors, published_date, abstract, url, categories) tuples
+    """
+    parsed = []
+    for row in rows:
+        try:
+            parsed.append((*parse_entry_id(row[0]), row))
+        except ValueError:
+            logging.warning(f"Skipping normalisation of paper with unexpected id: {row[0]}")
+    if not parsed:
+        return
+
+    conn.executemany("INSERT OR IGNORE INTO article_versions (arxiv_id, version, entry_id) VALUES (?, ?, ?)",
+                     [(arxiv_id, version, row[0]) for arxiv_id, version, row in parsed])
+    conn.executemany('''INSERT INTO articles (arxiv_id, title, abstract, published_date, latest_version, url)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(arxiv_id) DO UPDATE SET title = excluded.title, abstract = excluded.abstract,
+                        published_date = COALESCE(MIN(articles.published_date, excluded.published_date),
+                                                  articles.published_date, excluded.published_date),
+                        latest_version = excluded.latest_version, url = excluded.url
+                        WHERE excluded.latest_version >= articles.latest_version''',
+                     [(arxiv_id, row[1], row[4], row[3], version, row[5]) for arxiv_id, version, row in parsed])
+
+    # Only rows that are (still) the newest version of their article define its authors and categories
+    latest = {}
+    for arxiv_id, version, row in parsed:
+        if arxiv_id not in latest or version >= latest[arxiv_id][0]:
+            latest[arxiv_id] = (version, row)
+    current = {}
+    ids = list(latest)
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        chunk = ids[start:start + ID_CHUNK_SIZE]
+        current.update(conn.execute(f"SELECT arxiv_id, latest_version FROM articles "
+                                    f"WHERE arxiv_id IN ({', '.join('?' * len(chunk))})", chunk).fetchall())
+    latest = {arxiv_id: row for arxiv_id, (version, row) in latest.items() if current.get(arxiv_id) == version}
+
+    author_ids = _name_ids(conn, 'authors', 'author_id',
+                           [name for row in latest.values() for name in _split(row[2])])
+    category_ids = _name_ids(conn, 'categories', 'category_id',
+                             [name for row in latest.values() for name in _split(row[6])])
+    conn.executemany("DELETE FROM article_authors WHERE arxiv_id = ?", [(arxiv_id,) for arxiv_id in latest])
+    conn.executemany("DELETE FROM article_categories WHERE arxiv_id = ?", [(arxiv_id,) for arxiv_id in latest])
+    conn.executemany("INSERT INTO article_authors (arxiv_id, author_id, position) VALUES (?, ?, ?)",
+                     [(arxiv_id, author_ids[name], position)
+                      for arxiv_id, row in latest.items() for position, name in enumerate(_split(row[2]))])
+    conn.executemany("INSERT OR IGNORE INTO article_categories (arxiv_id, category_id) VALUES (?, ?)",
+                     [(arxiv_id, category_ids[name]) for arxiv_id, row in latest.items() for name in _split(row[6])])
+
+
+def articles_in_category(conn, category, since=None, until=None):
+    """
+    Category/date slice through the indexes.
+    :return: List of (arxiv_id, title, abstract, published_date) tuples, newest first
+    """
+    sql = '''SELECT a.arxiv_id, a.title, a.abstract, a.published_date
+             FROM categories c
+             JOIN article_categories ac ON ac.category_id = c.category_id
+             JOIN articles a ON a.arxiv_id = ac.arxiv_id
+             WHERE c.name = ?'''
+    params = [category]
+    if since:
+        sql += " AND a.published_date >= ?"
+        params.append(since)
+    if until:
+        sql += " AND a.published_date <= ?"
+        params.append(until)
+    return conn.execute(sql + " ORDER BY a.published_date DESC", params).fetchall()
+
+
+def articles_by_author(conn, name):
+    """:return: List of (arxiv_id, title, published_date) tuples of an author, newest first"""
+    return conn.execute('''SELECT a.arxiv_id, a.title, a.published_date
+                           FROM authors au
+                           JOIN article_authors aa ON aa.author_id = au.author_id
+                           JOIN articles a ON a.arxiv_id = aa.arxiv_id
+                           WHERE au.name = ? ORDER BY a.published_date DESC''', (name,)).fetchall()
+
+
+def main():
+    from arxiv_extractor_db import init_db
+
+    conn = init_db()
+    for table in ('papers', 'articles', 'article_versions', 'authors', 'categories'):
+        print(f"{table}: {conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]} rows")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,7 @@
 import arxiv
 import csv
 
-# Construct the default API client.
-client = arxiv.Client()
+from concurrent_fetch import fetch_queries
 
 # Define all the queries
 queries = [
@@ -38,23 +37,19 @@ queries = [
     '(("large language models" AND "AI planning") OR ("neurosymbolic AI" AND "task planning"))'
 ]
 
+# Fetch all queries concurrently behind a shared rate limiter
+results_by_query = fetch_queries(queries, max_results=1000, sort_by=arxiv.SortCriterion.SubmittedDate)
+
 # Open a CSV file to write the results
 with open('arxiv_papers.csv', mode='w', newline='') as file:
     writer = csv.writer(file)
     # Write the header row
     writer.writerow(['Title', 'Authors', 'Published Date', 'Abstract', 'URL'])
     
-    # Iterate over each query and fetch the results
+    # Write the results of each query, in query order
     for query in queries:
-        print(f"Executing query: {query}")
-        search = arxiv.Search(
-            query=query,
-            max_results=1000,
-            sort_by=arxiv.SortCriterion.SubmittedDate
-        )
-        
-        # Iterate over the results and write them to the CSV file
-        for result in client.results(search):
+        print(f"Found {len(results_by_query[query])} papers for query: {query}")
+        for result in results_by_query[query]:
             writer.writerow([
                 result.title,
                 ', '.join([author.name for author in result.authors]),
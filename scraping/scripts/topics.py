@@ -0,0 +1,130 @@
+"""
+Named research topics sharing one fetch.
+
+Each topic in the `topics` section of config.json has its own queries, must_include/optional_keywords and
+output directory:
+
+    "topics": {
+        "llm_planning": {"queries": [...], "must_include": [...], "optional_keywords": [...], "output_dir": "../out"}
+    }
+
+TopicEngine sends the union of all topics' queries to the API once. Every fetched paper is scanned once with a
+regex compiled from the keywords of all topics, and the set of keywords found decides which topics it belongs to.
+The matching topic names are stored in `paper_topics`, so a paper fetched for one group is tagged for every other
+group interested in it without being fetched again.
+
+Usage: python topics.py --retag    (tag the papers already in the database, e.g. after adding a topic)
+"""
+import argparse
+import json
+import os
+from collections import namedtuple
+from datetime import datetime
+
+from relevance import KeywordMatcher
+
+Topic = namedtuple('Topic', ['name', 'queries', 'must_include', 'optional_keywords', 'output_dir'])
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
+
+
+def load_topics(config=None):
+    """
+    Read the topics of a configuration dictionary (config.json next to this script if omitted).
+    A configuration without topics gets the topics of config.json, so they are only defined in one place.
+    :return: List of Topic, in config order
+    """
+    if config is None or not config.get('topics'):
+        with open(CONFIG_FILE, 'r') as f:
+            config = json.load(f)
+    topics = config.get('topics')
+    if not topics:
+        raise ValueError(f"No topics defined in {CONFIG_FILE}")
+    return [Topic(name, topic['queries'], topic['must_include'], topic['optional_keywords'], topic.get('output_dir'))
+            for name, topic in topics.items()]
+
+
+def init_topics(conn):
+    """Create the table tagging papers with the topics they are relevant to"""
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS paper_topics
+                 (paper_id TEXT, topic TEXT, tagged_at TEXT, PRIMARY KEY (paper_id, topic))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_paper_topics_topic ON paper_topics (topic)")
+    conn.commit()
+
+
+def tag_papers(conn, tags, tagged_at):
+    """
+    Store topic tags. Does not commit.
+    :param tags: Dictionary mapping paper id to a list of topic names
+    """
+    conn.executemany("INSERT OR IGNORE INTO paper_topics (paper_id, topic, tagged_at) VALUES (?, ?, ?)",
+                     [(paper_id, topic, tagged_at) for paper_id, names in tags.items() for topic in names])
+
+
+class TopicEngine:
+    def __init__(self, topics):
+        self.topics = list(topics)
+        # One regex over the keywords of all topics; each topic then only checks the set of keywords found.
+        # The matcher finds overlapping keywords, so one topic's keyword never hides another's.
+        self.matcher = KeywordMatcher([keyword for topic in self.topics
+                                       for keyword in topic.must_include + topic.optional_keywords], [])
+        self.tiers = [(topic.name, {keyword.lower() for keyword in topic.must_include},
+                       {keyword.lower() for keyword in topic.optional_keywords}) for topic in self.topics]
+
+    def queries(self):
+        """Union of all topics' queries, in topic order and without duplicates"""
+        return list(dict.fromkeys(query for topic in self.topics for query in topic.queries))
+
+    def match(self, text):
+        """Return the names of the topics the text is relevant to"""
+        found = self.matcher.matches(text)
+        return [name for name, must, optional in self.tiers
+                if not found.isdisjoint(must) and not found.isdisjoint(optional)]
+
+    def match_paper(self, paper):
+        """Match an arxiv.Result based on its title and abstract"""
+        return self.match(paper.title + " " + paper.summary)
+
+
+def retag(conn, engine, batch_size=10000):
+    """
+    Match every paper already in the database against the engine's topics and store the tags, without refetching.
+    :return: Number of (paper, topic) tags found
+    """
+    c = conn.cursor()
+    c.execute("SELECT id, title, abstract FROM papers")
+    tagged = 0
+    with conn:
+        while True:
+            rows = c.fetchmany(batch_size)
+            if not rows:
+                break
+            tags = {}
+            for paper_id, title, abstract in rows:
+                names = engine.match((title or '') + " " + (abstract or ''))
+                if names:
+                    tags[paper_id] = names
+                    tagged += len(names)
+            tag_papers(conn, tags, datetime.now().isoformat())
+    return tagged
+
+
+def main():
+    # Imported here so the module can be used without loading the extractor's configuration
+    from arxiv_extractor_db import TOPICS, init_db
+
+    parser = argparse.ArgumentParser(description="Manage the topic tags of the local papers database")
+    parser.add_argument('--retag', action='store_true', help="Tag the papers already in the database")
+    args = parser.parse_args()
+
+    conn = init_db()
+    if args.retag:
+        print(f"Found {retag(conn, TopicEngine(TOPICS))} topic tags")
+    for topic, count in conn.execute("SELECT topic, COUNT(*) FROM paper_topics GROUP BY topic ORDER BY topic"):
+        print(f"{topic}: {count} papers")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+
+def watermark_scope(topic_names):
+    """
+    Scope of the watermarks of a run: the set of topics it tags papers for.
+    A query shared by several topics gets one mark per scope, so a run for one topic doesn't move the mark past
+    papers that a run for another topic has not seen yet.
+    """
+    return ','.join(sorted(set(topic_names)))
+
+
+def init_watermarks(conn):
+    """Create the table holding the newest paper seen by each query in each scope"""
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS query_watermarks
+                 (scope TEXT NOT NULL, query TEXT NOT NULL, last_published TEXT, last_id TEXT, updated_at TEXT,
+                  PRIMARY KEY (scope, query))''')
+    conn.commit()
+
+
+def get_watermarks(conn, queries, scope=''):
+    """
+    Load the stored high-water marks for the given queries.
+    :param scope: Watermark scope of the run, from watermark_scope()
+    :return: Dictionary mapping query to (published datetime, entry_id). Queries never run before are left out.
+    """
+    c = conn.cursor()
+    c.execute(f"SELECT query, last_published, last_id FROM query_watermarks "
+              f"WHERE scope = ? AND query IN ({', '.join('?' * len(queries))})", [scope] + list(queries))
+    return {query: (datetime.fromisoformat(published), paper_id) for query, published, paper_id in c.fetchall()}
+
+
+def update_watermarks(conn, results_by_query, scope=''):
+    """
+    Store the newest paper of each query as its new high-water mark.
+    Results must be sorted by submission date, newest first. Queries without results keep their old mark.
+    :param scope: Watermark scope of the run, from watermark_scope()
+    """
+    now = datetime.now().isoformat()
+    rows = [(scope, query, results[0].published.isoformat(), results[0].entry_id, now)
+            for query, results in results_by_query.items() if results]
+    c = conn.cursor()
+    c.executemany('''INSERT INTO query_watermarks (scope, query, last_published, last_id, updated_at)
+                     VALUES (?, ?, ?, ?, ?)
+                     ON CONFLICT(scope, query) DO UPDATE SET last_published = excluded.last_published,
+                     last_id = excluded.last_id, updated_at = excluded.updated_at''', rows)
+    conn.commit()
+
+
+def until_watermark(results, watermark):
+    """
+    Yield results (sorted by submission date, newest first) until an already-seen paper is reached.
+    Since the arxiv client pages lazily, stopping here also stops further page requests.
+    """
+    last_published, last_id = watermark
+    for paper in results:
+        if paper.published < last_published or paper.entry_id == last_id:
+            return
+        yield paper
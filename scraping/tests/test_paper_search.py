@@ -0,0 +1,71 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from paper_search import init_fts, relevant_papers
+from relevance import KeywordMatcher, match_db_rows
+from topics import load_topics
+
+DB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'db', 'arxiv_papers.db')
+
+MUST_INCLUDE = ["large language models", "LLMs", "GPT", "BERT", "transformers"]
+OPTIONAL_KEYWORDS = ["automated planning", "task planning", "AI planning", "PDDL", "constraint-based planning"]
+
+
+def create_papers(conn):
+    conn.execute('''CREATE TABLE papers (id TEXT PRIMARY KEY, title TEXT, authors TEXT, published_date TEXT,
+                    abstract TEXT, url TEXT, categories TEXT)''')
+
+
+def relevant_ids(conn, must_include, optional_keywords):
+    return {row[0] for row in relevant_papers(conn, must_include, optional_keywords)}
+
+
+def matcher_ids(conn, must_include, optional_keywords):
+    return {paper_id for paper_id, _ in match_db_rows(conn, KeywordMatcher(must_include, optional_keywords))}
+
+
+def test_relevance_uses_substring_semantics():
+    conn = sqlite3.connect(':memory:')
+    create_papers(conn)
+    init_fts(conn)
+    papers = [
+        ('1', "ChatGPT as a planner", "Task planning with PDDL."),
+        ('2', "Vision transformers", "Hierarchical task planning."),
+        ('3', "A transformer", "Task planning."),
+        ('4', "LLMs do automated", "planning poorly."),
+        ('5', "Using BERT for constraint-based planning", None),
+        ('6', "Nothing relevant", "Just planning."),
+        ('7', "gpt-4 and AI-planning", "AI planning benchmarks."),
+    ]
+    conn.executemany("INSERT INTO papers (id, title, abstract) VALUES (?, ?, ?)", papers)
+    expected = matcher_ids(conn, MUST_INCLUDE, OPTIONAL_KEYWORDS)
+    assert expected == {'1', '2', '4', '5', '7'}
+    assert relevant_ids(conn, MUST_INCLUDE, OPTIONAL_KEYWORDS) == expected
+
+    # The index follows updates and deletes
+    conn.execute("UPDATE papers SET title = 'A GPT planner' WHERE id = '3'")
+    conn.execute("DELETE FROM papers WHERE id = '1'")
+    assert relevant_ids(conn, MUST_INCLUDE, OPTIONAL_KEYWORDS) == matcher_ids(conn, MUST_INCLUDE, OPTIONAL_KEYWORDS)
+
+
+def test_short_keywords_fall_back_to_a_scan():
+    conn = sqlite3.connect(':memory:')
+    create_papers(conn)
+    init_fts(conn)
+    conn.executemany("INSERT INTO papers (id, title, abstract) VALUES (?, ?, ?)",
+                     [('1', "AI for planning", ""), ('2', "Planning", "")])
+    assert relevant_ids(conn, ["AI"], ["planning"]) == {'1'}
+
+
+@pytest.mark.skipif(not os.path.exists(DB_FILE), reason="no local papers database")
+def test_relevance_matches_keyword_matcher_on_local_store(tmp_path):
+    path = tmp_path / 'papers.db'
+    shutil.copy(DB_FILE, path)
+    conn = sqlite3.connect(path)
+    init_fts(conn)
+    for topic in load_topics():
+        assert relevant_ids(conn, topic.must_include, topic.optional_keywords) == \
+            matcher_ids(conn, topic.must_include, topic.optional_keywords)
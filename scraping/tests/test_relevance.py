@@ -0,0 +1,38 @@
+import random
+
+from relevance import KeywordMatcher
+
+MUST_INCLUDE = ["large language models", "LLMs", "GPT", "BERT", "transformers", "language model"]
+OPTIONAL_KEYWORDS = ["automated planning", "task planning", "hierarchical task planning", "PDDL",
+                     "model based planning", "planning"]
+
+
+def substring_is_relevant(text, must_include, optional_keywords):
+    """The original is_relevant check"""
+    text = text.lower()
+    return (any(keyword.lower() in text for keyword in must_include)
+            and any(keyword.lower() in text for keyword in optional_keywords))
+
+
+def test_overlapping_keywords_are_found():
+    matcher = KeywordMatcher(["language model"], ["model based planning"])
+    text = "A language model based planning approach"
+    assert matcher.is_relevant(text)
+    assert matcher.matches(text) == {"language model", "model based planning"}
+
+
+def test_contained_keywords_are_found():
+    matcher = KeywordMatcher(["GPT"], ["task planning"])
+    assert matcher.matches("GPT-4 for hierarchical task planning") == {"gpt", "task planning"}
+
+
+def test_matches_agree_with_substring_check():
+    keywords = {keyword.lower() for keyword in MUST_INCLUDE + OPTIONAL_KEYWORDS}
+    matcher = KeywordMatcher(MUST_INCLUDE, OPTIONAL_KEYWORDS)
+    words = ["large", "language", "models", "model", "based", "planning", "task", "hierarchical", "GPT", "GPTs",
+             "BERT", "transformers", "PDDL", "automated", "LLMs", "the", "a", "with"]
+    rng = random.Random(0)
+    for _ in range(2000):
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(0, 12)))
+        assert matcher.matches(text) == {keyword for keyword in keywords if keyword in text.lower()}
+        assert matcher.is_relevant(text) == substring_is_relevant(text, MUST_INCLUDE, OPTIONAL_KEYWORDS)
@@ -0,0 +1,19 @@
+from topics import Topic, TopicEngine
+
+
+def make_topic(name, must_include, optional_keywords):
+    return Topic(name, [], must_include, optional_keywords, None)
+
+
+def test_overlapping_keywords_of_two_topics():
+    engine = TopicEngine([make_topic('llm', ["language model"], ["reasoning"]),
+                          make_topic('planning', ["model based"], ["planning"])])
+    text = "A language model based planning approach with reasoning"
+    assert engine.match(text) == ['llm', 'planning']
+
+
+def test_topic_keyword_inside_another_topics_keyword():
+    engine = TopicEngine([make_topic('planning', ["hierarchical task planning"], ["robot"]),
+                          make_topic('tasks', ["task"], ["robot"])])
+    assert engine.match("Hierarchical task planning for a robot") == ['planning', 'tasks']
+    assert engine.match("A task for a robot") == ['tasks']